@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+from dagster import (
+    AssetKey,
+    AssetSelection,
+    asset,
+    define_asset_job,
+    get_dagster_logger,
+)
+
+from utilities.run_coordination import non_overlapping_schedule
+from utilities.utils import libpq_url
+
+# re-exported src partitions overlap the last export by this much, rewriting is idempotent
+INGEST_LOOKBACK = "15 minutes"
+# more changed partitions than this and one full rewrite is cheaper than the predicate
+MAX_INCREMENTAL_PARTITIONS = 200
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    # select run on postgres
+    select_sql: str
+    # tables behind it, their columns (and for src tables the oid and tuple
+    # counters) form the signature, a new signature means a full rewrite
+    relations: tuple[str, ...]
+    # player partition column and the (utc) timestamp expression of the month
+    player: str
+    partition_ts: str
+    # raw column the month partitions are selected by with range bounds,
+    # range_utc when it is a timestamptz (bounds are utc month starts)
+    range_column: str
+    range_utc: bool = False
+    # append-mostly src tables: only (player, month) partitions with rows ingested
+    # since the last export are rewritten
+    ingested_at: str | None = None
+    ingest_table: str | None = None
+    # dbt tables get a new oid on every build, so their (player, month)
+    # partitions are compared by this aggregate over the rows of src instead
+    fingerprint: str = "count(*)::text || ':' || coalesce(sum(hashtext(src::text)::bigint), 0)::text"
+
+
+EXPORT_TABLES: dict[str, ExportTable] = {
+    "src_chesscom_games": ExportTable(
+        "select * from src_chesscom.games",
+        ("src_chesscom.game_members", "src_chesscom.game_payloads"),
+        "username",
+        "end_time_utc at time zone 'utc'",
+        "end_time_utc",
+        range_utc=True,
+        ingested_at="ingested_at_utc",
+        ingest_table="src_chesscom.game_members",
+    ),
+    "chesscom_games": ExportTable(
+        "select * from chesscom.games",
+        ("chesscom.games",),
+        "username",
+        "end_dt",
+        "end_dt",
+    ),
+    "chesscom_game_moves": ExportTable(
+        """
+        select moves.*, games.username as game_username, games.end_dt as game_end_dt
+        from chesscom.game_moves as moves
+        inner join chesscom.games as games on games.id = moves.game_id
+        """,
+        ("chesscom.game_moves", "chesscom.games"),
+        "game_username",
+        "game_end_dt",
+        "game_end_dt",
+        # moves only change with their game, hashing every ply row is not worth it
+        fingerprint="count(*)::text || ':' || coalesce(sum(hashtext(src.game_id::text)::bigint), 0)::text",
+    ),
+    "chesscom_player_snapshot": ExportTable(
+        "select * from chesscom.player_snapshot",
+        ("chesscom.player_snapshot",),
+        "username",
+        "ingested_dt",
+        "ingested_dt",
+    ),
+}
+
+
+def _export_dir() -> Path:
+    env_dir = os.getenv("ANALYTICS_EXPORT_DIR")
+    if env_dir:
+        return Path(env_dir)
+    return Path(__file__).resolve().parents[2] / "analytics"
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _postgres_scalar(con, sql: str):
+    row = con.execute(f"select * from postgres_query('pg', {_sql_literal(sql)})").fetchone()
+    return row[0] if row else None
+
+
+def _signature(con, spec: ExportTable) -> str | None:
+    """
+    Catalog-only fingerprint of the source tables: their columns, and for src
+    tables the oid and the insert/update/delete counters. dbt rebuilds change
+    the oid every run, their content is compared per partition instead.
+    """
+    relations = ", ".join(_sql_literal(r) for r in spec.relations)
+    counters = (
+        "|| ':' || c.oid::text || ':' || coalesce(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0)::text"
+        if spec.ingest_table
+        else ""
+    )
+    return _postgres_scalar(
+        con,
+        f"""
+        select string_agg(
+            md5((
+                select string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ',' order by a.attnum)
+                from pg_attribute as a
+                where a.attrelid = c.oid and a.attnum > 0 and not a.attisdropped
+            )) {counters},
+            ',' order by r.relation
+        )
+        from unnest(array[{relations}]) as r(relation)
+        join pg_class as c on c.oid = to_regclass(r.relation)
+        left join pg_stat_user_tables as s on s.relid = c.oid
+        """,
+    )
+
+
+def _month_expr(spec: ExportTable) -> str:
+    return f"coalesce(to_char({spec.partition_ts}, 'YYYY-MM'), 'unknown')"
+
+
+def _changed_partitions(con, spec: ExportTable, since: str) -> tuple[list[tuple[str, str]], str | None]:
+    """(player, month) partitions with rows ingested after since, and the new bound."""
+    changes_sql = f"""
+        select
+            {spec.player} as player,
+            {_month_expr(spec)} as month,
+            max({spec.ingested_at})::text as ingested_at
+        from {spec.ingest_table}
+        where {spec.ingested_at} > {_sql_literal(since)}::timestamptz - interval '{INGEST_LOOKBACK}'
+        group by 1, 2
+    """
+    rows = con.execute(
+        f"select * from postgres_query('pg', {_sql_literal(changes_sql)})"
+    ).fetchall()
+    bound = max((ingested_at for _, _, ingested_at in rows), default=None)
+    return [(player, month) for player, month, _ in rows], bound
+
+
+def _partition_fingerprints(con, spec: ExportTable) -> dict[tuple[str, str], str]:
+    """Content fingerprint per (player, month), one aggregate scan on postgres."""
+    fingerprint_sql = f"""
+        select {spec.player} as player, {_month_expr(spec)} as month, {spec.fingerprint}
+        from ({spec.select_sql}) as src
+        group by 1, 2
+    """
+    rows = con.execute(
+        f"select * from postgres_query('pg', {_sql_literal(fingerprint_sql)})"
+    ).fetchall()
+    return {(player, month): fingerprint for player, month, fingerprint in rows}
+
+
+def _partition_predicate(spec: ExportTable, partitions: list[tuple[str, str]]) -> str:
+    """Raw-column filter with month range bounds, so postgres can use its indexes."""
+    terms = []
+    for player, month in partitions:
+        if month == "unknown":
+            ts_filter = f"{spec.range_column} is null"
+        else:
+            start = f"{_sql_literal(month + '-01')}::timestamp"
+            end = f"({start} + interval '1 month')"
+            if spec.range_utc:
+                start, end = f"({start} at time zone 'utc')", f"({end} at time zone 'utc')"
+            ts_filter = f"{spec.range_column} >= {start} and {spec.range_column} < {end}"
+        terms.append(f"({spec.player} = {_sql_literal(player)} and {ts_filter})")
+    return " or ".join(terms)
+
+
+def _copy_partitioned(con, spec: ExportTable, target: Path, where: str | None = None) -> None:
+    """One postgres scan written as hive partitions player=/month= under target."""
+    select_sql = f"""
+        select src.*, {spec.player} as player, {_month_expr(spec)} as month
+        from ({spec.select_sql}) as src
+        {f"where {where}" if where else ""}
+    """
+    con.execute(
+        f"""
+        copy (select * from postgres_query('pg', {_sql_literal(select_sql)}))
+        to {_sql_literal(str(target))}
+        (format parquet, compression zstd, partition_by (player, month), overwrite_or_ignore)
+        """
+    )
+
+
+def _replace_partitions(staging: Path, table_dir: Path) -> int:
+    """Moves every player=/month= directory of staging over the exported one."""
+    written = 0
+    for partition in sorted(staging.glob("*/*")):
+        target = table_dir / partition.relative_to(staging)
+        if target.exists():
+            shutil.rmtree(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partition.rename(target)
+        written += 1
+    shutil.rmtree(staging)
+    return written
+
+
+def _export_table(con, export_dir: Path, table_name: str, spec: ExportTable, state) -> dict:
+    table_dir = export_dir / table_name
+    staging = export_dir / f".{table_name}.staging"
+    if staging.exists():
+        shutil.rmtree(staging)
+
+    signature = _signature(con, spec)
+    if signature is None:
+        return {"status": "missing"}
+    if spec.ingest_table and state is not None and state[0] == signature and table_dir.exists():
+        return {"status": "unchanged"}
+
+    full = state is None or state[0] != signature or not table_dir.exists()
+    since = state[1] if state is not None else None
+    bound = None
+    fingerprints = None
+    partitions: list[tuple[str, str]] = []
+    removed: list[tuple[str, str]] = []
+    if spec.ingest_table:
+        if since and table_dir.exists():
+            partitions, bound = _changed_partitions(con, spec, since)
+            full = len(partitions) > MAX_INCREMENTAL_PARTITIONS
+        else:
+            full = True
+    else:
+        fingerprints = _partition_fingerprints(con, spec)
+        stored = {
+            (player, month): fingerprint
+            for player, month, fingerprint in con.execute(
+                "select player, month, fingerprint from export_partitions where table_name = ?",
+                [table_name],
+            ).fetchall()
+        }
+        partitions = [key for key, fingerprint in fingerprints.items() if stored.get(key) != fingerprint]
+        removed = [key for key in stored if key not in fingerprints]
+        full = full or len(partitions) > MAX_INCREMENTAL_PARTITIONS
+
+    if full:
+        if spec.ingest_table:
+            bound = _postgres_scalar(
+                con, f"select max({spec.ingested_at})::text from {spec.ingest_table}"
+            )
+        _copy_partitioned(con, spec, staging)
+        if table_dir.exists():
+            shutil.rmtree(table_dir)
+        staging.rename(table_dir)
+        result = {"status": "full", "partitions_written": len(list(table_dir.glob("*/*")))}
+    else:
+        written = 0
+        if partitions:
+            _copy_partitioned(con, spec, staging, _partition_predicate(spec, partitions))
+            written = _replace_partitions(staging, table_dir)
+        for player, month in removed:
+            shutil.rmtree(table_dir / f"player={player}" / f"month={month}", ignore_errors=True)
+        result = {
+            "status": "incremental" if partitions or removed else "unchanged",
+            "partitions_written": written,
+            "partitions_removed": len(removed),
+        }
+
+    if fingerprints is not None:
+        con.execute("delete from export_partitions where table_name = ?", [table_name])
+        if fingerprints:
+            con.executemany(
+                "insert into export_partitions (table_name, player, month, fingerprint) values (?, ?, ?, ?)",
+                [(table_name, player, month, fp) for (player, month), fp in fingerprints.items()],
+            )
+    con.execute(
+        "insert or replace into export_tables (table_name, signature, ingested_until, exported_at) "
+        "values (?, ?, ?, now())",
+        [table_name, signature, bound or since],
+    )
+    return result
+
+
+@asset(
+    key=AssetKey(["analytics", "parquet_export"]),
+    deps=[
+        AssetKey(["src_chesscom", "games"]),
+        AssetKey(["chesscom", "games"]),
+        AssetKey(["chesscom", "game_moves"]),
+        AssetKey(["chesscom", "player_snapshot"]),
+    ],
+)
+def analytics_parquet_export() -> dict:
+    """
+    Exports games and typed models to Parquet partitioned by player and month,
+    with a DuckDB catalog (`catalog.duckdb`) exposing one view per table.
+    src_chesscom.games is skipped without a scan while its catalog signature is
+    unchanged and otherwise only rewrites the (player, month) partitions with
+    newly ingested rows. dbt tables are rebuilt every run, so their partitions
+    are compared by a content fingerprint aggregated on postgres and only the
+    changed ones are exported. Changed partitions are selected by raw-column
+    range bounds and written in one COPY ... PARTITION_BY pass.
+    """
+    try:
+        import duckdb
+    except ImportError as exc:
+        raise ImportError(
+            "duckdb is required for the analytics export. Install the `tools` extras."
+        ) from exc
+
+    logger = get_dagster_logger()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    export_dir = _export_dir()
+    export_dir.mkdir(parents=True, exist_ok=True)
+    catalog_path = export_dir / "catalog.duckdb"
+
+    summary: dict[str, dict] = {}
+
+    con = duckdb.connect(str(catalog_path))
+    try:
+        con.execute("install postgres")
+        con.execute("load postgres")
+        con.execute(
+            f"attach {_sql_literal(libpq_url(POSTGRES_URL))} as pg (type postgres, read_only)"
+        )
+        con.execute("""
+            create table if not exists export_tables (
+                table_name varchar primary key,
+                signature varchar not null,
+                ingested_until varchar,
+                exported_at timestamptz not null
+            )
+        """)
+        con.execute("""
+            create table if not exists export_partitions (
+                table_name varchar not null,
+                player varchar not null,
+                month varchar not null,
+                fingerprint varchar not null,
+                primary key (table_name, player, month)
+            )
+        """)
+
+        for table_name, spec in EXPORT_TABLES.items():
+            state = con.execute(
+                "select signature, ingested_until from export_tables where table_name = ?",
+                [table_name],
+            ).fetchone()
+            summary[table_name] = _export_table(con, export_dir, table_name, spec, state)
+
+            table_dir = export_dir / table_name
+            if table_dir.exists():
+                parquet_glob = str(table_dir / "*" / "*" / "*.parquet")
+                con.execute(
+                    f"""
+                    create or replace view {table_name} as
+                    select * from read_parquet({_sql_literal(parquet_glob)}, hive_partitioning = true)
+                    """
+                )
+
+            logger.info("exported table=%s %s", table_name, summary[table_name])
+    finally:
+        con.close()
+
+    return {"catalog": str(catalog_path), "tables": summary}
+
+
+analytics_export_job = define_asset_job(
+    "analytics_export",
+    selection=AssetSelection.keys(AssetKey(["analytics", "parquet_export"])),
+)
+
+analytics_export_schedule = non_overlapping_schedule(
+    "analytics_export",
+    analytics_export_job,
+    "0 * * * *",
+    [AssetKey(["analytics", "parquet_export"])],
+)
@@ -2,7 +2,16 @@ import os
 from pathlib import Path
 from typing import Any
 
-from dagster import AssetKey, AutoMaterializePolicy, AutoMaterializeRule, MetadataValue
+from dagster import (
+    AssetKey,
+    AssetObservation,
+    AutoMaterializePolicy,
+    AutoMaterializeRule,
+    Config,
+    MetadataValue,
+    Output,
+)
+from sqlalchemy import create_engine
 
 try:
     from dagster_dbt import DbtCliResource, DagsterDbtTranslator, DbtProject, dbt_assets as dbt_assets_decorator
@@ -12,6 +21,16 @@ except ImportError as exc:
         "dagster-dbt is required to load dbt assets. Install it in your environment."
     ) from exc
 
+from utilities.dbt_run_results import (
+    SCALING_EXPONENT_THRESHOLD,
+    add_relation_stats,
+    explain_analyze,
+    model_timings,
+    record_run_history,
+    scaling_exponents,
+)
+from utilities.utils import utc_now
+
 
 def _repo_root() -> Path:
     return Path(__file__).resolve().parents[2]
@@ -183,10 +202,112 @@ dbt_project.prepare_if_dev()
 dbt_resource = DbtCliResource(project_dir=dbt_project, **_dbt_resource_kwargs)
 
 
+class DbtBuildConfig(Config):
+    # attach EXPLAIN (ANALYZE) plans for the N slowest models of this run
+    explain_slowest: int = 0
+
+
+def _run_results_metadata(context, invocation, explain_slowest: int) -> dict[str, dict]:
+    """
+    Per-model metadata from run_results.json, keyed by unique_id. Timings are
+    appended to dbt_ops.run_history and models whose runtime grows faster than
+    their input rows are flagged.
+    """
+    run_results = invocation.get_artifact("run_results.json")
+    timings = model_timings(run_results, invocation.get_artifact("manifest.json"))
+    metadata: dict[str, dict] = {
+        unique_id: {
+            "execution_time_seconds": MetadataValue.float(float(t["execution_time"])),
+            **(
+                {"rows_affected": MetadataValue.int(int(t["rows_affected"]))}
+                if t["rows_affected"] is not None
+                else {}
+            ),
+        }
+        for unique_id, t in timings.items()
+    }
+
+    postgres_url = os.getenv("POSTGRES_URL")
+    if not postgres_url or not timings:
+        return metadata
+
+    engine = create_engine(postgres_url)
+    with engine.begin() as conn:
+        add_relation_stats(conn, timings)
+        record_run_history(conn, run_results["metadata"]["invocation_id"], utc_now(), timings)
+        exponents = scaling_exponents(conn, list(timings))
+
+    for unique_id, t in timings.items():
+        if t.get("input_rows") is not None:
+            metadata[unique_id]["input_rows"] = MetadataValue.int(t["input_rows"])
+        elif t["parent_relations"]:
+            # a parent without dbt row counts or planner statistics
+            metadata[unique_id]["input_rows"] = MetadataValue.text("unknown")
+        if t.get("relation_bytes") is not None:
+            metadata[unique_id]["relation_bytes"] = MetadataValue.int(t["relation_bytes"])
+
+        exponent = exponents.get(unique_id)
+        if exponent is None:
+            continue
+        regression = exponent > SCALING_EXPONENT_THRESHOLD
+        metadata[unique_id]["runtime_scaling_exponent"] = MetadataValue.float(round(exponent, 3))
+        metadata[unique_id]["runtime_regression"] = MetadataValue.bool(regression)
+        if regression:
+            context.log.warning(
+                "dbt model %s runtime grows faster than its input (exponent=%.2f)",
+                unique_id,
+                exponent,
+            )
+
+    slowest = sorted(
+        (
+            (unique_id, t)
+            for unique_id, t in timings.items()
+            if t["status"] == "success" and t["compiled_code"]
+        ),
+        key=lambda item: item[1]["execution_time"],
+        reverse=True,
+    )[:explain_slowest]
+    for unique_id, t in slowest:
+        try:
+            plan = explain_analyze(engine, t["compiled_code"])
+        except Exception as exc:
+            context.log.warning("explain analyze failed for %s: %s", unique_id, exc)
+            continue
+        metadata[unique_id]["explain_analyze"] = MetadataValue.md(f"```\n{plan}\n```")
+
+    return metadata
+
+
 @dbt_assets_decorator(
     manifest=dbt_project.manifest_path,
     dagster_dbt_translator=ChessDagsterDbtTranslator(),
     project=dbt_project,
 )
-def dbt_assets(context, dbt: DbtCliResource):
-    yield from dbt.cli(["build"], context=context).stream()
+def dbt_assets(context, dbt: DbtCliResource, config: DbtBuildConfig):
+    invocation = dbt.cli(["build"], context=context, raise_on_error=False)
+    # outputs go out as models finish so downstream automation is not held
+    # back, run_results.json only exists once the build is done, its timings
+    # follow as observations of the materialized assets
+    asset_keys: dict[str, AssetKey] = {}
+    for event in invocation.stream():
+        if isinstance(event, Output):
+            unique_id = event.metadata.get("unique_id")
+            unique_id = getattr(unique_id, "value", unique_id)
+            if unique_id:
+                asset_keys[unique_id] = context.asset_key_for_output(event.output_name)
+        yield event
+
+    try:
+        run_metadata = _run_results_metadata(context, invocation, config.explain_slowest)
+    except Exception as exc:
+        # timings are best effort, never hide dbt's own error
+        context.log.warning("dbt run_results enrichment failed: %s", exc)
+        run_metadata = {}
+
+    for unique_id, metadata in run_metadata.items():
+        if unique_id in asset_keys:
+            yield AssetObservation(asset_key=asset_keys[unique_id], metadata=metadata)
+
+    if not invocation.is_successful():
+        raise invocation.get_error()
@@ -2,9 +2,14 @@ from __future__ import annotations
 
 import os
 
-from dagster import AssetKey, AssetSelection, asset, define_asset_job
+from dagster import AssetKey, AssetSelection, asset, define_asset_job, get_dagster_logger
 from sqlalchemy import create_engine, text
 
+from utilities.chess_positions import packed_moves
+from utilities.generated_columns import desired_columns, provision
+
+REPACK_BATCH_SIZE = 1000
+
 
 def _run_ddl(statements: list[str]) -> None:
     postgres_url = os.getenv("POSTGRES_URL")
@@ -17,6 +22,33 @@ def _run_ddl(statements: list[str]) -> None:
             conn.execute(text(stmt))
 
 
+# last successful fetch per player for the snapshot refresh policy, named like the
+# unnamed indexes older swaps created, so the migration below never duplicates them
+_CREATE_ARCHIVES_FETCH_INDEX = """
+    create index if not exists archives_username_ingested_at_utc_idx
+    on src_chesscom.archives (username, ingested_at_utc desc) where error is null
+"""
+
+_CREATE_PLAYER_STATS_FETCH_INDEX = """
+    create index if not exists player_stats_username_ingested_at_utc_idx
+    on src_chesscom.player_stats (username, ingested_at_utc desc) where error is null
+"""
+
+# one row per skip streak: a player's endpoint skipped since its last fetch
+_CREATE_SNAPSHOT_SKIPS = """
+    create table if not exists src_chesscom.snapshot_skips (
+        method text not null,
+        username text not null,
+        last_fetch_utc timestamptz not null,
+        first_skipped_at_utc timestamptz not null,
+        last_skipped_at_utc timestamptz not null,
+        skips integer not null default 1,
+        last_game_end_utc timestamptz,
+        primary key (method, username, last_fetch_utc)
+    )
+"""
+
+
 @asset(name="src_chesscom_player_swap", key_prefix=["admin"])
 def src_chesscom_player_swap() -> dict[str, str]:
     statements = [
@@ -50,31 +82,301 @@ def src_chesscom_archives_swap() -> dict[str, str]:
             error text
         )
         """,
+        _CREATE_ARCHIVES_FETCH_INDEX,
     ]
     _run_ddl(statements)
     return {"table": "src_chesscom.archives", "status": "recreated"}
 
 
+_DROP_GAMES_RELATION = """
+    do $$
+    begin
+        -- src_chesscom.games is a view over the deduplicated tables,
+        -- or a table on databases that predate them
+        if to_regclass('src_chesscom.games') is not null then
+            if (select relkind from pg_class where oid = to_regclass('src_chesscom.games')) = 'v' then
+                drop view src_chesscom.games cascade;
+            else
+                drop table src_chesscom.games cascade;
+            end if;
+        end if;
+    end $$
+"""
+
+_CREATE_GAME_PAYLOADS = """
+    create table src_chesscom.game_payloads (
+        game_id bigint generated always as identity primary key,
+        game_url text not null unique,
+        uuid text,
+        stored_at_utc timestamptz not null,
+        payload jsonb,
+        -- per-ply packed moves, see utilities.chess_positions.packed_moves
+        move_san text[],
+        clock_ds int4[],
+        move_from smallint[],
+        move_to smallint[],
+        move_promo smallint[]
+    )
+"""
+
+_CREATE_GAME_MEMBERS = """
+    create table src_chesscom.game_members (
+        username text not null,
+        player_name text,
+        game_url text not null,
+        color text,
+        end_time_utc timestamptz,
+        ingested_at_utc timestamptz not null,
+        error text,
+        unique (username, game_url)
+    )
+"""
+
+# latest game per player, one index probe each (ingest watermarks, snapshot refresh policy)
+_CREATE_GAME_MEMBERS_END_TIME_INDEX = """
+    create index if not exists game_members_username_end_time_idx
+    on src_chesscom.game_members (username, end_time_utc desc)
+"""
+
+_CREATE_GAMES_VIEW = """
+    create view src_chesscom.games as
+    select
+        members.username,
+        members.player_name,
+        members.game_url,
+        members.color,
+        members.end_time_utc,
+        members.ingested_at_utc,
+        payloads.game_id,
+        payloads.payload,
+        members.error
+    from src_chesscom.game_members as members
+    left join src_chesscom.game_payloads as payloads using (game_url)
+"""
+
+
 @asset(name="src_chesscom_games_swap", key_prefix=["admin"])
 def src_chesscom_games_swap() -> dict[str, str]:
     statements = [
         "create schema if not exists src_chesscom",
-        "drop table if exists src_chesscom.games cascade",
+        _DROP_GAMES_RELATION,
+        "drop table if exists src_chesscom.game_members cascade",
+        "drop table if exists src_chesscom.game_payloads cascade",
+        _CREATE_GAME_PAYLOADS,
+        _CREATE_GAME_MEMBERS,
+        _CREATE_GAME_MEMBERS_END_TIME_INDEX,
+        _CREATE_GAMES_VIEW,
+    ]
+    _run_ddl(statements)
+    return {"table": "src_chesscom.games", "status": "recreated"}
+
+
+@asset(name="src_chesscom_games_dedup_migration", key_prefix=["admin"])
+def src_chesscom_games_dedup_migration() -> dict:
+    """
+    Moves a pre-dedup src_chesscom.games table into game_payloads (one payload
+    per game_url) + game_members, and reports the storage saved.
+    """
+    postgres_url = os.getenv("POSTGRES_URL")
+    if not postgres_url:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(postgres_url)
+    with engine.begin() as conn:
+        relkind = conn.execute(text("""
+            select relkind
+            from pg_class
+            where oid = to_regclass('src_chesscom.games')
+        """)).scalar()
+        if relkind != "r":
+            return {"table": "src_chesscom.games", "status": "already migrated"}
+
+        bytes_before = conn.execute(
+            text("select pg_total_relation_size('src_chesscom.games')")
+        ).scalar()
+
+        statements = [
+            "alter table src_chesscom.games rename to games_legacy",
+            "drop table if exists src_chesscom.game_members cascade",
+            "drop table if exists src_chesscom.game_payloads cascade",
+            _CREATE_GAME_PAYLOADS,
+            _CREATE_GAME_MEMBERS,
+            """
+            insert into src_chesscom.game_payloads (game_url, uuid, stored_at_utc, payload)
+            select distinct on (game_url)
+                game_url,
+                payload->>'uuid',
+                ingested_at_utc,
+                payload
+            from src_chesscom.games_legacy
+            order by game_url, payload is not null desc, ingested_at_utc desc
+            """,
+            """
+            insert into src_chesscom.game_members (
+                username, player_name, game_url, color, end_time_utc, ingested_at_utc, error
+            )
+            select
+                username,
+                player_name,
+                game_url,
+                case
+                    when lower(payload->'white'->>'username') = lower(username) then 'white'
+                    when lower(payload->'black'->>'username') = lower(username) then 'black'
+                end,
+                end_time_utc,
+                ingested_at_utc,
+                error
+            from src_chesscom.games_legacy
+            """,
+            _CREATE_GAME_MEMBERS_END_TIME_INDEX,
+            _CREATE_GAMES_VIEW,
+            "drop table src_chesscom.games_legacy",
+        ]
+        for stmt in statements:
+            conn.execute(text(stmt))
+
+        bytes_after = conn.execute(text("""
+            select pg_total_relation_size('src_chesscom.game_payloads')
+                + pg_total_relation_size('src_chesscom.game_members')
+        """)).scalar()
+
+    return {
+        "table": "src_chesscom.games",
+        "status": "migrated",
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_before - bytes_after,
+    }
+
+
+@asset(name="src_chesscom_game_moves_repack", key_prefix=["admin"])
+def src_chesscom_game_moves_repack() -> dict:
+    """
+    Fills the packed move arrays on game_payloads rows stored before ingest
+    started writing them (adds the columns first on older databases), and
+    reports pg_total_relation_size of game_payloads before and after.
+    """
+    logger = get_dagster_logger()
+
+    postgres_url = os.getenv("POSTGRES_URL")
+    if not postgres_url:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(postgres_url)
+    size_sql = text("select pg_total_relation_size('src_chesscom.game_payloads')")
+    with engine.connect() as conn:
+        bytes_before = conn.execute(size_sql).scalar()
+
+    _run_ddl([
+        """
+        alter table src_chesscom.game_payloads
+            add column if not exists move_san text[],
+            add column if not exists clock_ds int4[],
+            add column if not exists move_from smallint[],
+            add column if not exists move_to smallint[],
+            add column if not exists move_promo smallint[]
+        """,
+    ])
+
+    select_sql = text("""
+        select game_id, payload->'parsed_pgn' as parsed_pgn, payload->>'tcn' as tcn
+        from src_chesscom.game_payloads
+        where move_san is null
+          and payload->'parsed_pgn'->'moves' is not null
+        order by game_id
+        limit :batch_size
+    """)
+    update_sql = text("""
+        update src_chesscom.game_payloads
+        set move_san = :move_san,
+            clock_ds = :clock_ds,
+            move_from = :move_from,
+            move_to = :move_to,
+            move_promo = :move_promo
+        where game_id = :game_id
+    """)
+
+    repacked = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select_sql, {"batch_size": REPACK_BATCH_SIZE}).all()
+            if not rows:
+                break
+
+            updates = []
+            for game_id, parsed_pgn, tcn in rows:
+                packed = packed_moves({"parsed_pgn": parsed_pgn, "tcn": tcn})
+                # an empty move list still marks the row as done
+                packed["move_san"] = packed["move_san"] or []
+                updates.append({"game_id": game_id, **packed})
+            conn.execute(update_sql, updates)
+
+        repacked += len(rows)
+        logger.info("repacked games=%s", repacked)
+
+    with engine.connect() as conn:
+        bytes_after = conn.execute(size_sql).scalar()
+    logger.info("game_payloads bytes_before=%s bytes_after=%s", bytes_before, bytes_after)
+
+    return {
+        "table": "src_chesscom.game_payloads",
+        "games_repacked": repacked,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+    }
+
+
+@asset(name="src_chesscom_game_positions_swap", key_prefix=["admin"])
+def src_chesscom_game_positions_swap() -> dict[str, str]:
+    statements = [
+        "create schema if not exists src_chesscom",
+        "drop table if exists src_chesscom.game_positions cascade",
+        "drop table if exists src_chesscom.game_positions_log cascade",
         """
-        create table src_chesscom.games (
-            username text not null,
-            player_name text,
-            game_url text not null,
-            end_time_utc timestamptz,
-            ingested_at_utc timestamptz not null,
-            payload jsonb,
+        create table src_chesscom.game_positions (
+            position_hash bigint not null,
+            game_id bigint not null,
+            ply smallint not null
+        )
+        """,
+        # covering index so lookups and opening trees are index-only scans
+        """
+        create index game_positions_position_hash_idx
+        on src_chesscom.game_positions (position_hash)
+        include (game_id, ply)
+        """,
+        """
+        create table src_chesscom.game_positions_log (
+            game_id bigint primary key,
+            plies integer not null,
             error text,
-            unique (username, game_url)
+            indexed_at_utc timestamptz not null
         )
         """,
     ]
     _run_ddl(statements)
-    return {"table": "src_chesscom.games", "status": "recreated"}
+    return {"table": "src_chesscom.game_positions", "status": "recreated"}
+
+
+@asset(name="src_chesscom_games_backfill_swap", key_prefix=["admin"])
+def src_chesscom_games_backfill_swap() -> dict[str, str]:
+    statements = [
+        "create schema if not exists src_chesscom",
+        "drop table if exists src_chesscom.games_backfill cascade",
+        """
+        create table src_chesscom.games_backfill (
+            username text not null,
+            archive_month text not null,
+            games_upserted integer,
+            completed_at_utc timestamptz,
+            attempts integer not null default 0,
+            last_error text,
+            primary key (username, archive_month)
+        )
+        """,
+    ]
+    _run_ddl(statements)
+    return {"table": "src_chesscom.games_backfill", "status": "recreated"}
 
 
 @asset(name="src_chesscom_player_stats_swap", key_prefix=["admin"])
@@ -91,6 +393,7 @@ def src_chesscom_player_stats_swap() -> dict[str, str]:
             error text
         )
         """,
+        _CREATE_PLAYER_STATS_FETCH_INDEX,
     ]
     _run_ddl(statements)
     return {"table": "src_chesscom.player_stats", "status": "recreated"}
@@ -134,13 +437,125 @@ def src_chesscom_tournaments_swap() -> dict[str, str]:
     return {"table": "src_chesscom.tournaments", "status": "recreated"}
 
 
+@asset(name="src_chesscom_snapshot_skips_swap", key_prefix=["admin"])
+def src_chesscom_snapshot_skips_swap() -> dict[str, str]:
+    statements = [
+        "create schema if not exists src_chesscom",
+        "drop table if exists src_chesscom.snapshot_skips cascade",
+        _CREATE_SNAPSHOT_SKIPS,
+    ]
+    _run_ddl(statements)
+    return {"table": "src_chesscom.snapshot_skips", "status": "recreated"}
+
+
+@asset(name="src_chesscom_snapshot_policy_migration", key_prefix=["admin"])
+def src_chesscom_snapshot_policy_migration() -> dict:
+    """
+    Adds what the snapshot refresh policy reads and writes to an existing
+    database without dropping data: the last-fetch and last-game indexes and
+    src_chesscom.snapshot_skips (recreated if it still has the per-tick layout).
+    """
+    postgres_url = os.getenv("POSTGRES_URL")
+    if not postgres_url:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(postgres_url)
+    report = {}
+    with engine.begin() as conn:
+        conn.execute(text("create schema if not exists src_chesscom"))
+        for table, stmt in [
+            ("src_chesscom.archives", _CREATE_ARCHIVES_FETCH_INDEX),
+            ("src_chesscom.player_stats", _CREATE_PLAYER_STATS_FETCH_INDEX),
+            ("src_chesscom.game_members", _CREATE_GAME_MEMBERS_END_TIME_INDEX),
+        ]:
+            exists = conn.execute(text("select to_regclass(:table) is not null"), {"table": table})
+            if not exists.scalar():
+                report[table] = "missing"
+                continue
+            conn.execute(text(stmt))
+            report[table] = "indexed"
+
+        legacy_skips = conn.execute(text("""
+            select 1
+            from information_schema.columns
+            where table_schema = 'src_chesscom'
+                and table_name = 'snapshot_skips'
+                and column_name = 'skipped_at_utc'
+        """)).first()
+        if legacy_skips:
+            # only audit rows, one per skipped player and tick
+            conn.execute(text("drop table src_chesscom.snapshot_skips"))
+        conn.execute(text(_CREATE_SNAPSHOT_SKIPS))
+        report["src_chesscom.snapshot_skips"] = "recreated" if legacy_skips else "ok"
+
+    return report
+
+
+@asset(
+    name="src_chesscom_generated_columns",
+    key_prefix=["admin"],
+    deps=[
+        AssetKey(["admin", "src_chesscom_player_swap"]),
+        AssetKey(["admin", "src_chesscom_games_swap"]),
+    ],
+)
+def src_chesscom_generated_columns() -> dict:
+    """
+    Stored generated columns on the src_chesscom tables for the payload paths in
+    the dbt column_mapping of models with `generated_columns_from`, which
+    type_mapper then reads instead of the jsonb. Re-run after editing a mapping.
+    """
+    postgres_url = os.getenv("POSTGRES_URL")
+    if not postgres_url:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    logger = get_dagster_logger()
+    engine = create_engine(postgres_url)
+    report = {}
+    with engine.begin() as conn:
+        for table, columns in desired_columns().items():
+            report[table] = provision(conn, table, columns)
+            for skip in report[table]["skipped"]:
+                logger.warning("%s: no generated column for %s (%s)", table, skip["expression"], skip["error"])
+
+    return report
+
+
+@asset(name="src_lichess_games_swap", key_prefix=["admin"])
+def src_lichess_games_swap() -> dict[str, str]:
+    statements = [
+        "create schema if not exists src_lichess",
+        "drop table if exists src_lichess.games cascade",
+        """
+        create table src_lichess.games (
+            username text not null,
+            player_name text,
+            game_id text not null,
+            created_at_utc timestamptz,
+            end_time_utc timestamptz,
+            ingested_at_utc timestamptz not null,
+            payload jsonb,
+            error text,
+            unique (username, game_id)
+        )
+        """,
+    ]
+    _run_ddl(statements)
+    return {"table": "src_lichess.games", "status": "recreated"}
+
+
 _admin_asset_keys = [
     AssetKey(["admin", "src_chesscom_player_swap"]),
     AssetKey(["admin", "src_chesscom_archives_swap"]),
     AssetKey(["admin", "src_chesscom_games_swap"]),
+    AssetKey(["admin", "src_chesscom_games_backfill_swap"]),
+    AssetKey(["admin", "src_chesscom_game_positions_swap"]),
     AssetKey(["admin", "src_chesscom_player_stats_swap"]),
     AssetKey(["admin", "src_chesscom_games_to_move_swap"]),
     AssetKey(["admin", "src_chesscom_tournaments_swap"]),
+    AssetKey(["admin", "src_chesscom_snapshot_skips_swap"]),
+    AssetKey(["admin", "src_lichess_games_swap"]),
+    AssetKey(["admin", "src_chesscom_generated_columns"]),
 ]
 
 src_chesscom_swap = define_asset_job(
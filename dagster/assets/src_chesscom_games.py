@@ -3,26 +3,43 @@ from __future__ import annotations
 import asyncio
 import json
 import os
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
 
 import aiohttp
-from sqlalchemy import create_engine, text
+import asyncpg
 from dagster import AssetKey, Field, asset, get_dagster_logger
 
 from chess_guru import ChesscomAPI
-from utilities.utils import load_players_from_yaml, utc_now
-
-
-def _latest_end_time_utc(engine, username: str) -> datetime | None:
-    sql = text("""
-        select max(end_time_utc) as max_end_time
-        from src_chesscom.games
-        where username = :username
-    """)
+from utilities.chess_positions import packed_moves
+from utilities.profiling import profiled, run_async
+from utilities.run_coordination import CHESSCOM_API_POOL
+from utilities.utils import libpq_url, load_players_from_yaml, utc_now
+
+BACKFILL_CONCURRENCY = 4
+BACKFILL_MIN_INTERVAL_SECONDS = 0.25
+BACKFILL_MAX_RETRIES = 5
+# runs a month may fail in before the player falls back to incremental ingest
+BACKFILL_MAX_MONTH_ATTEMPTS = 3
+DEFAULT_USER_AGENT = "chess-guru (chess.com API)"
+
+FETCH_CONCURRENCY = 4
+WRITERS = 2
+# fetchers wait once this many batches are queued for the writers
+WRITE_QUEUE_SIZE = 8
+
+
+async def _latest_end_times_utc(pool, usernames: list[str]) -> dict[str, datetime]:
+    sql = """
+        select username, max(end_time_utc) as max_end_time
+        from src_chesscom.game_members
+        where username = any($1::text[])
+        group by username
+    """
 
-    with engine.connect() as conn:
-        row = conn.execute(sql, {"username": username}).first()
-        return row[0] if row and row[0] is not None else None
+    rows = await pool.fetch(sql, usernames)
+    return {row["username"]: row["max_end_time"] for row in rows if row["max_end_time"]}
 
 
 def _extract_games(payload: dict) -> list[dict]:
@@ -39,52 +56,460 @@ def _extract_games(payload: dict) -> list[dict]:
     return out
 
 
-def _upsert_rows(engine, rows: list[dict]) -> int:
+def _player_color(username: str, game: dict) -> str | None:
+    for color in ("white", "black"):
+        side = game.get(color) or {}
+        if str(side.get("username", "")).lower() == username.lower():
+            return color
+    return None
+
+
+def _game_rows(
+    username: str,
+    player_name: str | None,
+    games: list[dict],
+    ingested_at: datetime,
+) -> list[dict]:
+    rows: list[dict] = []
+    for g in games:
+        game_url = g.get("url")
+        if not game_url:
+            continue
+
+        end_time = g.get("end_time")
+        end_time_utc = (
+            datetime.fromtimestamp(end_time, tz=timezone.utc)
+            if isinstance(end_time, (int, float))
+            else None
+        )
+
+        rows.append(
+            {
+                "username": username,
+                "player_name": player_name,
+                "game_url": game_url,
+                "uuid": g.get("uuid"),
+                "color": _player_color(username, g),
+                "end_time_utc": end_time_utc,
+                "ingested_at_utc": ingested_at,
+                "payload": json.dumps(g),
+                "error": None,
+                **packed_moves(g),
+            }
+        )
+
+    return rows
+
+
+WRITE_STATS = ("games_upserted", "payloads_skipped", "payload_bytes_skipped")
+
+_EXISTING_PAYLOADS_SQL = """
+    select game_url
+    from src_chesscom.game_payloads
+    where game_url = any($1::text[])
+"""
+
+_INSERT_PAYLOADS_SQL = """
+    insert into src_chesscom.game_payloads (
+        game_url,
+        uuid,
+        stored_at_utc,
+        payload,
+        move_san,
+        clock_ds,
+        move_from,
+        move_to,
+        move_promo
+    )
+    values (
+        $1,
+        $2,
+        $3,
+        $4::jsonb,
+        $5::text[],
+        $6::int4[],
+        $7::int2[],
+        $8::int2[],
+        $9::int2[]
+    )
+    on conflict (game_url) do nothing
+"""
+
+_UPSERT_MEMBERS_SQL = """
+    insert into src_chesscom.game_members (
+        username,
+        player_name,
+        game_url,
+        color,
+        end_time_utc,
+        ingested_at_utc,
+        error
+    )
+    values ($1, $2, $3, $4, $5, $6, $7)
+    on conflict (username, game_url)
+    do update set
+        player_name = excluded.player_name,
+        color = excluded.color,
+        end_time_utc = excluded.end_time_utc,
+        ingested_at_utc = excluded.ingested_at_utc,
+        error = excluded.error
+"""
+
+_CHECKPOINT_BACKFILL_SQL = """
+    update src_chesscom.games_backfill
+    set games_upserted = $3,
+        completed_at_utc = $4,
+        last_error = null
+    where username = $1
+      and archive_month = $2
+"""
+
+_FAIL_BACKFILL_SQL = """
+    update src_chesscom.games_backfill
+    set attempts = attempts + 1,
+        last_error = $3
+    where username = $1
+      and archive_month = $2
+"""
+
+
+async def _write_games(conn, rows: list[dict]) -> dict[str, int]:
+    """
+    Stores each game payload once (keyed by game_url) and a membership row per
+    tracked player. Payloads already stored, e.g. a game between two tracked
+    players, are never sent again.
+    """
+    stats = dict.fromkeys(WRITE_STATS, 0)
     if not rows:
-        return 0
-
-    sql = text("""
-        insert into src_chesscom.games (
-            username,
-            player_name,
-            game_url,
-            end_time_utc,
-            ingested_at_utc,
-            payload,
-            error
+        return stats
+
+    existing = {
+        row["game_url"]
+        for row in await conn.fetch(_EXISTING_PAYLOADS_SQL, [r["game_url"] for r in rows])
+    }
+
+    new_payloads: dict[str, dict] = {}
+    for r in rows:
+        if r["game_url"] in existing:
+            stats["payloads_skipped"] += 1
+            stats["payload_bytes_skipped"] += len(r["payload"])
+        else:
+            new_payloads.setdefault(r["game_url"], r)
+
+    # asyncpg pipelines executemany, one round trip per batch instead of per row
+    if new_payloads:
+        await conn.executemany(
+            _INSERT_PAYLOADS_SQL,
+            [
+                (
+                    r["game_url"],
+                    r["uuid"],
+                    r["ingested_at_utc"],
+                    r["payload"],
+                    r["move_san"],
+                    r["clock_ds"],
+                    r["move_from"],
+                    r["move_to"],
+                    r["move_promo"],
+                )
+                for r in new_payloads.values()
+            ],
+        )
+    await conn.executemany(
+        _UPSERT_MEMBERS_SQL,
+        [
+            (
+                r["username"],
+                r["player_name"],
+                r["game_url"],
+                r["color"],
+                r["end_time_utc"],
+                r["ingested_at_utc"],
+                r["error"],
+            )
+            for r in rows
+        ],
+    )
+
+    stats["games_upserted"] = len(rows)
+    return stats
+
+
+def _add_stats(summary: dict, stats: dict) -> None:
+    for key in WRITE_STATS:
+        summary[key] += stats[key]
+
+
+def _archive_month(archive_url: str) -> str:
+    # https://api.chess.com/pub/player/<username>/games/2024/03 -> 2024/03
+    return archive_url.rstrip("/").split("/games/")[-1]
+
+
+async def _pending_backfill_usernames(pool) -> set[str]:
+    """Players with months left to backfill that have not used up their attempts."""
+    sql = """
+        select distinct username
+        from src_chesscom.games_backfill
+        where completed_at_utc is null
+          and attempts < $1
+    """
+
+    return {row["username"] for row in await pool.fetch(sql, BACKFILL_MAX_MONTH_ATTEMPTS)}
+
+
+async def _register_backfill_months(
+    pool, username: str, months: list[str], force: bool = False
+) -> set[str]:
+    """
+    Records every archive month for a player as pending (if not already known)
+    and returns the months to skip: completed by a previous run or out of
+    attempts. A forced backfill resets the attempts and skips nothing.
+    """
+    insert_sql = """
+        insert into src_chesscom.games_backfill (username, archive_month)
+        values ($1, $2)
+        on conflict (username, archive_month) do nothing
+    """
+    reset_sql = """
+        update src_chesscom.games_backfill
+        set attempts = 0
+        where username = $1
+    """
+    skip_sql = """
+        select archive_month
+        from src_chesscom.games_backfill
+        where username = $1
+          and (completed_at_utc is not null or attempts >= $2)
+    """
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if months:
+                await conn.executemany(insert_sql, [(username, m) for m in months])
+            if force:
+                await conn.execute(reset_sql, username)
+                return set()
+            rows = await conn.fetch(skip_sql, username, BACKFILL_MAX_MONTH_ATTEMPTS)
+
+    return {row["archive_month"] for row in rows}
+
+
+async def _record_backfill_failure(pool, username: str, archive_month: str, exc: Exception) -> None:
+    try:
+        await pool.execute(_FAIL_BACKFILL_SQL, username, archive_month, str(exc)[:1000])
+    except Exception:
+        # the month stays pending either way, only its attempt is not counted
+        pass
+
+
+class _RateLimiter:
+    """Caps in-flight requests and spaces out request starts."""
+
+    def __init__(self, concurrency: int, min_interval_seconds: float):
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._lock = asyncio.Lock()
+        self._min_interval = min_interval_seconds
+        self._last_start = 0.0
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            wait = self._last_start + self._min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_start = loop.time()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+
+async def _fetch_archive_month(session, limiter: _RateLimiter, archive_url: str) -> list[dict]:
+    for attempt in range(BACKFILL_MAX_RETRIES):
+        async with limiter:
+            async with session.get(archive_url) as resp:
+                if resp.status == 404:
+                    return []
+                if resp.status != 429:
+                    resp.raise_for_status()
+                    payload = await resp.json()
+                    return payload.get("games", []) or []
+
+        # chess.com answers 429 when parallel requests exceed its limit
+        await asyncio.sleep(2**attempt)
+
+    raise RuntimeError(f"rate limited fetching {archive_url}")
+
+
+def _format_eta(seconds: float) -> str:
+    return str(timedelta(seconds=int(max(seconds, 0))))
+
+
+class _BackfillProgress:
+    """
+    Counts a player's backfilled months as writers commit them and logs an ETA.
+    The backfill is complete once every pending month was written.
+    """
+
+    def __init__(self, username: str, pending: int, logger):
+        self.username = username
+        self.pending = pending
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.logger = logger
+
+    def month_failed(self, archive_month: str, exc: Exception) -> None:
+        self.failed += 1
+        self.logger.warning(
+            "backfill failed username=%s month=%s: %s", self.username, archive_month, exc
         )
-        values (
-            :username,
-            :player_name,
-            :game_url,
-            :end_time_utc,
-            :ingested_at_utc,
-            cast(:payload as jsonb),
-            :error
+
+    def month_written(self, archive_month: str, stats: dict) -> None:
+        self.done += 1
+        elapsed = time.monotonic() - self.started
+        remaining = self.pending - self.done - self.failed
+        self.logger.info(
+            "backfill username=%s month=%s games=%s progress=%s/%s eta=%s",
+            self.username,
+            archive_month,
+            stats["games_upserted"],
+            self.done,
+            self.pending,
+            _format_eta(elapsed / self.done * remaining),
         )
-        on conflict (username, game_url)
-        do update set
-            player_name = excluded.player_name,
-            end_time_utc = excluded.end_time_utc,
-            ingested_at_utc = excluded.ingested_at_utc,
-            payload = excluded.payload,
-            error = excluded.error
-    """)
 
-    with engine.begin() as conn:
-        conn.execute(sql, rows)
+    @property
+    def complete(self) -> bool:
+        return self.failed == 0 and self.done == self.pending
+
+
+@dataclass
+class _WriteBatch:
+    username: str
+    rows: list[dict]
+    # backfill months are checkpointed in the same transaction as their games
+    archive_month: str | None = None
+    progress: _BackfillProgress | None = field(default=None, repr=False)
+
+
+async def _write_batch(pool, batch: _WriteBatch) -> dict[str, int]:
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            stats = await _write_games(conn, batch.rows)
+            if batch.archive_month is not None:
+                await conn.execute(
+                    _CHECKPOINT_BACKFILL_SQL,
+                    batch.username,
+                    batch.archive_month,
+                    len(batch.rows),
+                    utc_now(),
+                )
+
+    return stats
+
+
+async def _backfill_player(
+    pool,
+    session,
+    api,
+    limiter: _RateLimiter,
+    write_queue: asyncio.Queue,
+    player,
+    ingested_at: datetime,
+    logger,
+    force: bool = False,
+) -> _BackfillProgress:
+    """
+    Downloads a player's history month by month and queues each archive month
+    as its own write, so a restarted run only fetches months that are not checkpointed.
+    A month failing in BACKFILL_MAX_MONTH_ATTEMPTS runs is skipped from then on,
+    `force` fetches every month again.
+    """
+    username = player.username
+    async with limiter:
+        archives = await api.get_archives(username)
+    month_urls = archives.get("archives", []) or []
+    months = {_archive_month(url): url for url in month_urls}
+
+    skipped = await _register_backfill_months(pool, username, list(months), force)
+    pending = [(m, url) for m, url in months.items() if m not in skipped]
+
+    logger.info(
+        "backfill username=%s months=%s skipped=%s pending=%s force=%s",
+        username,
+        len(months),
+        len(skipped),
+        len(pending),
+        force,
+    )
 
-    return len(rows)
+    progress = _BackfillProgress(username, len(pending), logger)
+
+    async def backfill_month(archive_month: str, archive_url: str) -> None:
+        try:
+            games = await _fetch_archive_month(session, limiter, archive_url)
+        except Exception as exc:
+            progress.month_failed(archive_month, exc)
+            await _record_backfill_failure(pool, username, archive_month, exc)
+            return
+
+        rows = _game_rows(username, player.player_name, games, ingested_at)
+        await write_queue.put(_WriteBatch(username, rows, archive_month, progress))
+
+    await asyncio.gather(*(backfill_month(m, url) for m, url in pending))
+    return progress
 
 
 @asset(
     key=AssetKey(["src_chesscom", "games"]),
-    config_schema={"usernames": Field([str], is_required=False)},
+    pool=CHESSCOM_API_POOL,
+    config_schema={
+        "usernames": Field([str], is_required=False),
+        "backfill": Field(
+            bool,
+            default_value=False,
+            description=(
+                "Force a month-by-month history backfill for the selected players, "
+                "including months already checkpointed or out of attempts."
+            ),
+        ),
+        "backfill_concurrency": Field(int, default_value=BACKFILL_CONCURRENCY),
+        "fetch_concurrency": Field(
+            int,
+            default_value=FETCH_CONCURRENCY,
+            description="Players downloaded at the same time.",
+        ),
+        "writers": Field(
+            int,
+            default_value=WRITERS,
+            description="Concurrent Postgres writers (one pooled connection each).",
+        ),
+        "write_queue_size": Field(
+            int,
+            default_value=WRITE_QUEUE_SIZE,
+            description="Batches buffered between fetchers and writers before fetchers wait.",
+        ),
+        "profile": Field(
+            bool,
+            default_value=False,
+            description="Sample the run and attach a flamegraph + hot functions (also via run tag).",
+        ),
+    },
 )
 def chesscom_games(context) -> dict:
     """
     Incremental ingest for Chess.com games.
     Can be triggered by a sensor or run manually.
+
+    Fetchers download players concurrently and hand batches to asyncpg writers
+    over a bounded queue, so network and database work overlap and fetchers
+    pause whenever the writers fall behind.
+
+    Players without any ingested games (or with an unfinished backfill) are
+    backfilled month by month from their archives, see `_backfill_player`.
+    players_backfilled only counts players whose pending months were all written.
     """
     logger = get_dagster_logger()
 
@@ -92,87 +517,176 @@ def chesscom_games(context) -> dict:
     if not POSTGRES_URL:
         raise ValueError("Missing env var POSTGRES_URL")
 
-    engine = create_engine(POSTGRES_URL)
-
     target_usernames = set(context.op_config.get("usernames", []) or [])
+    force_backfill = context.op_config.get("backfill", False)
+    backfill_concurrency = context.op_config.get("backfill_concurrency", BACKFILL_CONCURRENCY)
+    fetch_concurrency = max(1, context.op_config.get("fetch_concurrency", FETCH_CONCURRENCY))
+    writers = max(1, context.op_config.get("writers", WRITERS))
+    write_queue_size = max(1, context.op_config.get("write_queue_size", WRITE_QUEUE_SIZE))
     players = [
         p
-        for p in load_players_from_yaml()
-        if not target_usernames or getattr(p, "username", None) in target_usernames
+        for p in load_players_from_yaml("chesscom")
+        if getattr(p, "username", None)
+        and (not target_usernames or p.username in target_usernames)
     ]
 
     async def ingest_all() -> dict:
         ingested_at = utc_now()
+        started = time.monotonic()
         summary = {
             "players_seen": len(players),
             "players_ingested": 0,
-            "games_upserted": 0,
+            "players_backfilled": 0,
+            "players_backfill_incomplete": 0,
+            **dict.fromkeys(WRITE_STATS, 0),
+            "write_seconds": 0.0,
         }
 
-        async with aiohttp.ClientSession() as session:
-            api = ChesscomAPI(session)
-
-            for p in players:
-                username = getattr(p, "username", None)
-                if not username:
-                    continue
-
-                last_end = _latest_end_time_utc(engine, username)
-
-                from_ts = None
-                if last_end is not None:
-                    from_ts = last_end + timedelta(seconds=1)
-
-                logger.info("ingest username=%s from_ts=%s", username, from_ts)
+        player_queue: asyncio.Queue = asyncio.Queue()
+        for p in players:
+            player_queue.put_nowait(p)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=write_queue_size)
+        write_errors: list[Exception] = []
+        backfills: list[_BackfillProgress] = []
 
+        pool = await asyncpg.create_pool(
+            libpq_url(POSTGRES_URL), min_size=1, max_size=writers + 1
+        )
+        try:
+            last_end_by_user = await _latest_end_times_utc(pool, [p.username for p in players])
+            pending_backfill = await _pending_backfill_usernames(pool)
+            user_agent = os.getenv("CHESS_GURU_USER_AGENT", DEFAULT_USER_AGENT)
+
+            async with aiohttp.ClientSession(headers={"User-Agent": user_agent}) as session:
+                api = ChesscomAPI(session)
+                limiter = _RateLimiter(backfill_concurrency, BACKFILL_MIN_INTERVAL_SECONDS)
+
+                async def fetcher() -> None:
+                    while not player_queue.empty():
+                        p = player_queue.get_nowait()
+                        username = p.username
+                        last_end = last_end_by_user.get(username)
+
+                        if force_backfill or last_end is None or username in pending_backfill:
+                            try:
+                                progress = await _backfill_player(
+                                    pool,
+                                    session,
+                                    api,
+                                    limiter,
+                                    write_queue,
+                                    p,
+                                    ingested_at,
+                                    logger,
+                                    force=force_backfill,
+                                )
+                            except Exception as exc:
+                                logger.warning(
+                                    "chesscom backfill failed for username=%s: %s",
+                                    username,
+                                    exc,
+                                )
+                                summary["players_backfill_incomplete"] += 1
+                                continue
+
+                            # counted once the writers are done with its months
+                            backfills.append(progress)
+                            continue
+
+                        from_ts = last_end + timedelta(seconds=1)
+
+                        logger.info("ingest username=%s from_ts=%s", username, from_ts)
+
+                        try:
+                            async with limiter:
+                                payload = await api.get_games(
+                                    username=username,
+                                    from_ts=from_ts,
+                                    to_ts=utc_now(),
+                                )
+                        except Exception as exc:
+                            logger.warning(
+                                "chesscom get_games failed for username=%s: %s",
+                                username,
+                                exc,
+                            )
+                            continue
+
+                        games = _extract_games(payload)
+                        if not games:
+                            continue
+
+                        rows = _game_rows(
+                            username, getattr(p, "player_name", None), games, ingested_at
+                        )
+                        # blocks while the queue is full, i.e. the writers are behind
+                        await write_queue.put(_WriteBatch(username, rows))
+                        summary["players_ingested"] += 1
+
+                async def writer() -> None:
+                    while True:
+                        batch = await write_queue.get()
+                        if batch is None:
+                            return
+
+                        write_started = time.monotonic()
+                        try:
+                            stats = await _write_batch(pool, batch)
+                        except Exception as exc:
+                            if batch.progress is not None:
+                                # the month stays pending and is retried next run
+                                batch.progress.month_failed(batch.archive_month, exc)
+                                await _record_backfill_failure(
+                                    pool, batch.username, batch.archive_month, exc
+                                )
+                            else:
+                                logger.warning(
+                                    "chesscom games write failed for username=%s: %s",
+                                    batch.username,
+                                    exc,
+                                )
+                                write_errors.append(exc)
+                            continue
+                        finally:
+                            summary["write_seconds"] += time.monotonic() - write_started
+
+                        _add_stats(summary, stats)
+                        if batch.progress is not None:
+                            batch.progress.month_written(batch.archive_month, stats)
+
+                writer_tasks = [asyncio.create_task(writer()) for _ in range(writers)]
                 try:
-                    payload = await api.get_games(
-                        username=username,
-                        from_ts=from_ts,
-                        to_ts=utc_now(),
-                    )
-                except Exception as exc:
-                    logger.warning(
-                        "chesscom get_games failed for username=%s: %s",
-                        username,
-                        exc,
-                    )
-                    continue
-
-                games = _extract_games(payload)
-                if not games:
-                    continue
-
-                rows: list[dict] = []
-                for g in games:
-                    game_url = g.get("url")
-                    if not game_url:
-                        continue
-
-                    end_time = g.get("end_time")
-                    end_time_utc = (
-                        datetime.fromtimestamp(end_time, tz=timezone.utc)
-                        if isinstance(end_time, (int, float))
-                        else None
-                    )
-
-                    rows.append(
-                        {
-                            "username": username,
-                            "player_name": getattr(p, "player_name", None),
-                            "game_url": game_url,
-                            "end_time_utc": end_time_utc,
-                            "ingested_at_utc": ingested_at,
-                            "payload": json.dumps(g),
-                            "error": None,
-                        }
-                    )
-
-                upserted = _upsert_rows(engine, rows)
-
-                summary["players_ingested"] += 1
-                summary["games_upserted"] += upserted
+                    await asyncio.gather(*(fetcher() for _ in range(fetch_concurrency)))
+                finally:
+                    # one sentinel per writer, queued behind the remaining batches
+                    for _ in writer_tasks:
+                        await write_queue.put(None)
+                    await asyncio.gather(*writer_tasks)
+        finally:
+            await pool.close()
+
+        for progress in backfills:
+            key = "players_backfilled" if progress.complete else "players_backfill_incomplete"
+            summary[key] += 1
+
+        summary["wall_seconds"] = round(time.monotonic() - started, 3)
+        summary["write_seconds"] = round(summary["write_seconds"], 3)
+        logger.info(
+            "chesscom games wall_seconds=%s write_seconds=%s games_upserted=%s",
+            summary["wall_seconds"],
+            summary["write_seconds"],
+            summary["games_upserted"],
+        )
+
+        if write_errors:
+            # incremental players resume from their watermark, surface the failure
+            raise write_errors[0]
 
         return summary
 
-    return asyncio.run(ingest_all())
+    with profiled(context, "chesscom_games", enabled=context.op_config.get("profile", False)) as profiler:
+        summary = run_async(ingest_all(), profiler)
+    if profiler is not None:
+        context.add_output_metadata(profiler.metadata())
+
+    return summary
@@ -4,21 +4,30 @@ import asyncio
 import inspect
 import json
 import os
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 
 import aiohttp
 from sqlalchemy import create_engine, text
 from dagster import (
+    AssetExecutionContext,
     AssetKey,
     AssetSelection,
-    DefaultScheduleStatus,
-    ScheduleDefinition,
-    asset,
+    AssetSpec,
+    Config,
+    MaterializeResult,
     define_asset_job,
     get_dagster_logger,
+    multi_asset,
 )
 
 from chess_guru import ChesscomAPI
+from utilities.profiling import profiled, run_async
+from utilities.run_coordination import (
+    CHESSCOM_API_POOL,
+    CHESSCOM_INGEST_RUN_TAGS,
+    non_overlapping_schedule,
+)
 from utilities.utils import load_players_from_yaml, utc_now
 
 DEFAULT_USER_AGENT = "chess-guru (chess.com API)"
@@ -85,7 +94,7 @@ def _table_name(method_name: str) -> str:
     return f"src_chesscom.{safe_name}"
 
 
-def _insert_rows(engine, table_name: str, rows: list[dict]) -> int:
+def _insert_rows(conn, table_name: str, rows: list[dict]) -> int:
     if not rows:
         return 0
 
@@ -106,137 +115,301 @@ def _insert_rows(engine, table_name: str, rows: list[dict]) -> int:
         )
     """)
 
-    with engine.begin() as conn:
-        conn.execute(sql, rows)
+    conn.execute(sql, rows)
 
     return len(rows)
 
 
-def _build_chesscom_asset(method_name: str):
-    asset_name = _table_basename(method_name)
-
-    @asset(name=asset_name, key_prefix=["src_chesscom"])
-    def _asset():
-        logger = get_dagster_logger()
-        players = [p for p in load_players_from_yaml()]
-        usernames = [
-            getattr(p, "username", None)
-            for p in players
-            if getattr(p, "username", None)
-        ]
-        ingested_at_dt = utc_now()
-        ingested_at = ingested_at_dt.isoformat()
-
-        async def fetch_all():
-            results: dict[str, object] = {}
-            errors: dict[str, str] = {}
-
-            if not usernames:
-                return results, errors
-
-            user_agent = os.getenv("CHESS_GURU_USER_AGENT", DEFAULT_USER_AGENT)
-            timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
-
-            async with aiohttp.ClientSession(
-                timeout=timeout,
-                headers={"User-Agent": user_agent},
-            ) as session:
-                try:
-                    api = ChesscomAPI(session, user_agent=user_agent)
-                except TypeError:
-                    api = ChesscomAPI(session)
-
-                method = getattr(api, method_name)
-
-                for username in usernames:
-                    try:
-                        payload = await _call_api_method(method, username)
-                        not_found_message = _not_found_from_payload(payload)
-                        if not_found_message:
-                            errors[username] = f"not_found: {not_found_message}"
-                            results[username] = None
-                            logger.warning(
-                                "chesscom %s not found for username=%s",
-                                method_name,
-                                username,
-                            )
-                            continue
+def _asset_key(method_name: str) -> AssetKey:
+    return AssetKey(["src_chesscom", _table_basename(method_name)])
 
-                        results[username] = payload
-                    except Exception as exc:
-                        errors[username] = str(exc)
-                        if _is_not_found_exception(exc):
-                            logger.warning(
-                                "chesscom %s not found for username=%s",
-                                method_name,
-                                username,
-                            )
-                        else:
-                            logger.exception(
-                                "chesscom %s failed for username=%s",
-                                method_name,
-                                username,
-                            )
-
-            return results, errors
-
-        results, errors = asyncio.run(fetch_all())
-
-        POSTGRES_URL = os.getenv("POSTGRES_URL")
-        if not POSTGRES_URL:
-            raise ValueError("Missing env var POSTGRES_URL")
 
-        engine = create_engine(POSTGRES_URL)
-        table_name = _table_name(method_name)
+async def _fetch_endpoint(api, method_name: str, username: str) -> tuple[object, str | None]:
+    """(payload, error) for one endpoint and player, not-found payloads become errors."""
+    logger = get_dagster_logger()
+    try:
+        payload = await _call_api_method(getattr(api, method_name), username)
+    except Exception as exc:
+        if _is_not_found_exception(exc):
+            logger.warning("chesscom %s not found for username=%s", method_name, username)
+        else:
+            logger.exception("chesscom %s failed for username=%s", method_name, username)
+        return None, str(exc)
+
+    not_found_message = _not_found_from_payload(payload)
+    if not_found_message:
+        logger.warning("chesscom %s not found for username=%s", method_name, username)
+        return None, f"not_found: {not_found_message}"
+
+    return payload, None
+
+
+async def _fetch_all(plan: dict[str, list[str]]):
+    """
+    results/errors per method and username for plan (method -> usernames).
+    Endpoints of a player are fetched concurrently over one keep-alive session,
+    players one after another.
+    """
+    results: dict[str, dict[str, object]] = {name: {} for name in plan}
+    errors: dict[str, dict[str, str]] = {name: {} for name in plan}
+
+    usernames = list(dict.fromkeys(u for names in plan.values() for u in names))
+    if not usernames:
+        return results, errors
+
+    user_agent = os.getenv("CHESS_GURU_USER_AGENT", DEFAULT_USER_AGENT)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+    connector = aiohttp.TCPConnector(limit_per_host=len(plan))
+
+    async with aiohttp.ClientSession(
+        timeout=timeout,
+        headers={"User-Agent": user_agent},
+        connector=connector,
+    ) as session:
+        try:
+            api = ChesscomAPI(session, user_agent=user_agent)
+        except TypeError:
+            api = ChesscomAPI(session)
 
-        rows: list[dict] = []
         for username in usernames:
-            payload = results.get(username)
-            rows.append(
-                {
-                    "method": method_name,
-                    "username": username,
-                    "ingested_at_utc": ingested_at_dt,
-                    "payload": json.dumps(payload)
-                    if payload is not None
-                    else None,
-                    "error": errors.get(username),
-                }
+            method_names = [name for name, planned in plan.items() if username in planned]
+            fetched = await asyncio.gather(
+                *(_fetch_endpoint(api, name, username) for name in method_names)
             )
+            for method_name, (payload, error) in zip(method_names, fetched):
+                results[method_name][username] = payload
+                if error is not None:
+                    errors[method_name][username] = error
 
-        _insert_rows(engine, table_name, rows)
+    return results, errors
 
-        return {
-            "method": method_name,
-            "players_seen": len(usernames),
-            "results": results,
-            "errors": errors,
-            "ingested_at_utc": ingested_at,
-        }
 
-    return _asset
+def _last_fetches(conn, method_name: str, usernames: list[str]) -> dict[str, datetime]:
+    """Latest successful fetch per player, one index probe each."""
+    sql = text(f"""
+        select u.username, (
+            select max(ingested_at_utc)
+            from {_table_name(method_name)} as snapshots
+            where snapshots.username = u.username and snapshots.error is null
+        ) as last_fetch
+        from unnest(cast(:usernames as text[])) as u(username)
+    """)
+    rows = conn.execute(sql, {"usernames": usernames}).all()
+    return {username: last_fetch for username, last_fetch in rows if last_fetch is not None}
+
+
+def _last_game_ends(conn, usernames: list[str]) -> dict[str, datetime]:
+    exists = conn.execute(text("select to_regclass('src_chesscom.game_members') is not null"))
+    if not exists.scalar():
+        return {}
+
+    sql = text("""
+        select u.username, (
+            select max(end_time_utc)
+            from src_chesscom.game_members as members
+            where members.username = u.username
+        ) as last_game_end
+        from unnest(cast(:usernames as text[])) as u(username)
+    """)
+    rows = conn.execute(sql, {"usernames": usernames}).all()
+    return {username: end for username, end in rows if end is not None}
+
+
+def _record_skips(conn, skips: list[dict]) -> bool:
+    """
+    Counts skips into one row per player, endpoint and last fetch, so the table
+    grows with fetches rather than ticks. False while the table does not exist.
+    """
+    exists = conn.execute(text("select to_regclass('src_chesscom.snapshot_skips') is not null"))
+    if not exists.scalar():
+        return False
+
+    conn.execute(
+        text("""
+            insert into src_chesscom.snapshot_skips (
+                method,
+                username,
+                last_fetch_utc,
+                first_skipped_at_utc,
+                last_skipped_at_utc,
+                last_game_end_utc
+            )
+            values (
+                :method,
+                :username,
+                :last_fetch_utc,
+                :skipped_at_utc,
+                :skipped_at_utc,
+                :last_game_end_utc
+            )
+            on conflict (method, username, last_fetch_utc) do update set
+                skips = snapshot_skips.skips + 1,
+                last_skipped_at_utc = excluded.last_skipped_at_utc,
+                last_game_end_utc = excluded.last_game_end_utc
+        """),
+        skips,
+    )
+    return True
+
+
+def _refresh_reason(
+    last_fetch: datetime | None,
+    last_game_end: datetime | None,
+    now: datetime,
+    max_staleness: timedelta,
+) -> str | None:
+    """Why a game-driven endpoint should be fetched again, None to skip it."""
+    if last_fetch is None:
+        return "never_fetched"
+    last_fetch = last_fetch.astimezone(timezone.utc)
+    if last_game_end is not None and last_game_end > last_fetch:
+        return "new_games"
+    if (last_fetch.year, last_fetch.month) != (now.year, now.month):
+        return "month_rollover"
+    if now - last_fetch >= max_staleness:
+        return "max_staleness"
+    return None
 
 
 CHESSCOM_METHOD_NAMES = _chesscom_method_names()
 CHESSCOM_ASSET_NAMES = [_table_basename(name) for name in CHESSCOM_METHOD_NAMES]
-CHESSCOM_ASSETS = []
+# only change when a player finishes a game or a month starts
+GAME_DRIVEN_METHOD_NAMES = {"get_archives", "get_player_stats"}
 
-for _method_name in CHESSCOM_METHOD_NAMES:
-    _asset_def = _build_chesscom_asset(_method_name)
-    CHESSCOM_ASSETS.append(_asset_def)
-    globals()[_method_name] = _asset_def
 
+class SnapshotRefreshConfig(Config):
+    # game-driven endpoints are fetched at least this often without new games
+    max_staleness_minutes: int = 24 * 60
+    # fetch every selected endpoint for every player, ignoring the policy
+    force: bool = False
+    # sample the step and attach a flamegraph + hot functions (also via run tag)
+    profile: bool = False
 
-_asset_keys = [AssetKey(["src_chesscom", name]) for name in CHESSCOM_ASSET_NAMES]
+
+@multi_asset(
+    name="src_chesscom_snapshots",
+    specs=[AssetSpec(_asset_key(name), skippable=True) for name in CHESSCOM_METHOD_NAMES],
+    can_subset=True,
+    pool=CHESSCOM_API_POOL,
+)
+def src_chesscom_snapshots(context: AssetExecutionContext, config: SnapshotRefreshConfig):
+    """
+    One step for every selected chess.com snapshot endpoint: the roster is read
+    once, all endpoints share one HTTP session and every table is written in one
+    transaction, each endpoint still materializes its own src_chesscom asset.
+
+    archives and player_stats are only fetched for a player with games in
+    src_chesscom.game_members past the last fetch, on a new month or after
+    max_staleness_minutes, skips are counted in src_chesscom.snapshot_skips.
+    """
+    method_names = [
+        name for name in CHESSCOM_METHOD_NAMES if _asset_key(name) in context.selected_asset_keys
+    ]
+    usernames = [p.username for p in load_players_from_yaml("chesscom") if p.username]
+    ingested_at_dt = utc_now()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    with profiled(context, "src_chesscom_snapshots", enabled=config.profile) as profiler:
+        engine = create_engine(POSTGRES_URL)
+        max_staleness = timedelta(minutes=config.max_staleness_minutes)
+        plan = {name: list(usernames) for name in method_names}
+        reasons: dict[str, dict[str, int]] = {name: {} for name in method_names}
+        skips: list[dict] = []
+
+        game_driven = [name for name in method_names if name in GAME_DRIVEN_METHOD_NAMES]
+        if game_driven and usernames and not config.force:
+            with engine.connect() as conn:
+                last_game_ends = _last_game_ends(conn, usernames)
+                for method_name in game_driven:
+                    last_fetches = _last_fetches(conn, method_name, usernames)
+                    plan[method_name] = []
+                    for username in usernames:
+                        reason = _refresh_reason(
+                            last_fetches.get(username),
+                            last_game_ends.get(username),
+                            ingested_at_dt,
+                            max_staleness,
+                        )
+                        counts = reasons[method_name]
+                        counts[reason or "skipped"] = counts.get(reason or "skipped", 0) + 1
+                        if reason:
+                            plan[method_name].append(username)
+                            continue
+                        skips.append(
+                            {
+                                "method": method_name,
+                                "username": username,
+                                "skipped_at_utc": ingested_at_dt,
+                                "last_fetch_utc": last_fetches[username],
+                                "last_game_end_utc": last_game_ends.get(username),
+                            }
+                        )
+
+        started = time.perf_counter()
+        results, errors = run_async(_fetch_all(plan), profiler)
+        fetch_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            for method_name in method_names:
+                rows = [
+                    {
+                        "method": method_name,
+                        "username": username,
+                        "ingested_at_utc": ingested_at_dt,
+                        "payload": json.dumps(results[method_name].get(username))
+                        if results[method_name].get(username) is not None
+                        else None,
+                        "error": errors[method_name].get(username),
+                    }
+                    for username in plan[method_name]
+                ]
+                _insert_rows(conn, _table_name(method_name), rows)
+            if skips and not _record_skips(conn, skips):
+                context.log.warning(
+                    "src_chesscom.snapshot_skips does not exist, run "
+                    "admin/src_chesscom_snapshot_policy_migration to record skips."
+                )
+        write_seconds = time.perf_counter() - started
+
+    for method_name in method_names:
+        if not plan[method_name]:
+            # nothing written, downstream models have nothing new to build from
+            context.log.info(
+                "skipped %s for all %s players: %s", method_name, len(usernames), reasons[method_name]
+            )
+            continue
+        yield MaterializeResult(
+            asset_key=_asset_key(method_name),
+            metadata={
+                "method": method_name,
+                "players_seen": len(usernames),
+                "players_fetched": len(plan[method_name]),
+                "refresh_reasons": reasons[method_name],
+                "errors": len(errors[method_name]),
+                "error_usernames": sorted(errors[method_name]),
+                "ingested_at_utc": ingested_at_dt.isoformat(),
+                "fetch_seconds": round(fetch_seconds, 3),
+                "write_seconds": round(write_seconds, 3),
+                **(profiler.metadata() if profiler is not None else {}),
+            },
+        )
+
+
+_asset_keys = [_asset_key(name) for name in CHESSCOM_METHOD_NAMES]
 
 src_chesscom_player_job = define_asset_job(
     "src_chesscom",
     selection=AssetSelection.keys(*_asset_keys),
+    tags=CHESSCOM_INGEST_RUN_TAGS,
 )
 
-src_chesscom_schedule = ScheduleDefinition(
-    name="src_chesscom",
-    job=src_chesscom_player_job,
-    cron_schedule="*/5 * * * *",
-    default_status=DefaultScheduleStatus.RUNNING,
+src_chesscom_schedule = non_overlapping_schedule(
+    "src_chesscom",
+    src_chesscom_player_job,
+    "*/5 * * * *",
+    _asset_keys,
 )
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine, text
+from dagster import AssetKey, AutomationCondition, Field, asset, get_dagster_logger
+
+from utilities.chess_positions import position_hashes
+from utilities.run_coordination import POSTGRES_WRITER_POOL
+from utilities.utils import utc_now
+
+BATCH_SIZE = 2000
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+
+def _last_indexed_game_id(engine) -> int:
+    """High-water mark of the index, game_id is an identity so new games sort after it."""
+    sql = text("select coalesce(max(game_id), 0) from src_chesscom.game_positions_log")
+    with engine.connect() as conn:
+        return conn.execute(sql).scalar()
+
+
+def _unindexed_games(engine, last_game_id: int, batch_size: int) -> list[tuple]:
+    # one primary key range scan per batch
+    sql = text("""
+        select
+            payloads.game_id,
+            payloads.payload->>'tcn' as tcn,
+            payloads.payload->>'initial_setup' as initial_setup,
+            payloads.payload->>'rules' as rules
+        from src_chesscom.game_payloads as payloads
+        where payloads.game_id > :last_game_id
+        order by payloads.game_id
+        limit :batch_size
+    """)
+
+    params = {"last_game_id": last_game_id, "batch_size": batch_size}
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(sql, params)]
+
+
+def _index_game(game: tuple) -> tuple[int, list[int], str | None]:
+    game_id, tcn, initial_setup, rules = game
+    if rules not in (None, "chess"):
+        return game_id, [], f"unsupported rules: {rules}"
+    if not tcn:
+        return game_id, [], "missing tcn"
+
+    try:
+        return game_id, position_hashes(tcn, initial_setup), None
+    except (ValueError, IndexError) as exc:
+        return game_id, [], str(exc)
+
+
+def _copy_batch(engine, results: list[tuple[int, list[int], str | None]]) -> int:
+    """Bulk loads positions with COPY and logs every game in the same transaction."""
+    positions = io.StringIO()
+    log = io.StringIO()
+    indexed_at = utc_now().isoformat()
+    rows = 0
+
+    for game_id, hashes, error in results:
+        for ply, position_hash in enumerate(hashes):
+            positions.write(f"{position_hash}\t{game_id}\t{ply}\n")
+        rows += len(hashes)
+        error_field = (
+            "\\N"
+            if error is None
+            else error.replace("\\", "\\\\").replace("\t", " ").replace("\n", " ")
+        )
+        log.write(f"{game_id}\t{len(hashes)}\t{error_field}\t{indexed_at}\n")
+
+    positions.seek(0)
+    log.seek(0)
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.copy_expert(
+                "copy src_chesscom.game_positions (position_hash, game_id, ply) from stdin",
+                positions,
+            )
+            cur.copy_expert(
+                "copy src_chesscom.game_positions_log (game_id, plies, error, indexed_at_utc) from stdin",
+                log,
+            )
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+    return rows
+
+
+@asset(
+    key=AssetKey(["src_chesscom", "game_positions"]),
+    deps=[AssetKey(["src_chesscom", "games"])],
+    automation_condition=AutomationCondition.eager(),
+    pool=POSTGRES_WRITER_POOL,
+    config_schema={
+        "workers": Field(int, default_value=DEFAULT_WORKERS),
+        "batch_size": Field(int, default_value=BATCH_SIZE),
+    },
+)
+def chesscom_game_positions(context) -> dict:
+    """
+    Zobrist position index over ingested games.
+    Replays the TCN move list of every game past the last indexed game_id in a
+    process pool and COPYs one (position_hash, game_id, ply) row per position, e.g.
+
+        select game_id, ply
+        from src_chesscom.game_positions
+        where position_hash = <utilities.chess_positions.fen_position_hash(fen)>
+    """
+    logger = get_dagster_logger()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(POSTGRES_URL)
+    workers = context.op_config.get("workers", DEFAULT_WORKERS)
+    batch_size = context.op_config.get("batch_size", BATCH_SIZE)
+
+    summary = {"games_indexed": 0, "games_skipped": 0, "positions_loaded": 0}
+
+    last_game_id = _last_indexed_game_id(engine)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            games = _unindexed_games(engine, last_game_id, batch_size)
+            if not games:
+                break
+            last_game_id = games[-1][0]
+
+            chunksize = max(1, len(games) // (workers * 4))
+            results = list(pool.map(_index_game, games, chunksize=chunksize))
+            summary["positions_loaded"] += _copy_batch(engine, results)
+
+            skipped = sum(1 for _, _, error in results if error)
+            summary["games_skipped"] += skipped
+            summary["games_indexed"] += len(results) - skipped
+
+            logger.info(
+                "indexed games=%s skipped=%s positions=%s",
+                summary["games_indexed"],
+                summary["games_skipped"],
+                summary["positions_loaded"],
+            )
+
+    return summary
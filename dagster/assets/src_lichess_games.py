@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import asyncpg
+from dagster import (
+    AssetKey,
+    AssetSelection,
+    Field,
+    asset,
+    define_asset_job,
+    get_dagster_logger,
+)
+
+from utilities.run_coordination import (
+    LICHESS_API_POOL,
+    LICHESS_INGEST_RUN_TAGS,
+    non_overlapping_schedule,
+)
+from utilities.utils import libpq_url, load_players_from_yaml, utc_now
+
+LICHESS_EXPORT_URL = "https://lichess.org/api/games/user/{username}"
+DEFAULT_USER_AGENT = "chess-dagster (lichess API)"
+CHUNK_SIZE = 500
+# lichess asks clients to wait a full minute after a 429
+RATE_LIMIT_WAIT_SECONDS = 60
+# a single ndjson line holds one game incl. clocks, well under this
+READ_BUFSIZE = 2**20
+# re-read margin before the watermark, the upsert absorbs games already stored
+DEFAULT_LOOKBACK_HOURS = 72
+# export statuses of games that have not finished yet
+ONGOING_STATUSES = {"created", "started"}
+
+# `since` filters on createdAt, so a game still running at the last export is
+# created before the watermark later games leave behind. Correspondence games
+# run for weeks, no fixed lookback covers them: the export lists them as
+# ongoing, they are kept here and hold the watermark back until they finish.
+_CREATE_ONGOING_SQL = """
+    create table if not exists src_lichess.ongoing_games (
+        username text not null,
+        game_id text not null,
+        created_at_utc timestamptz not null,
+        seen_at_utc timestamptz not null,
+        primary key (username, game_id)
+    )
+"""
+
+
+async def _since_watermark(pool, username: str) -> datetime | None:
+    sql = """
+        select least(
+            (select max(created_at_utc) from src_lichess.games where username = $1),
+            (select min(created_at_utc) from src_lichess.ongoing_games where username = $1)
+        )
+    """
+
+    return await pool.fetchval(sql, username)
+
+
+async def _replace_ongoing(pool, username: str, ongoing: list[tuple], seen_at: datetime) -> None:
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "delete from src_lichess.ongoing_games where username = $1", username
+            )
+            await conn.executemany(
+                """
+                insert into src_lichess.ongoing_games (username, game_id, created_at_utc, seen_at_utc)
+                values ($1, $2, $3, $4)
+                on conflict (username, game_id) do nothing
+                """,
+                [(username, game_id, created_at, seen_at) for game_id, created_at in ongoing],
+            )
+
+
+def _ms_to_utc(value) -> datetime | None:
+    if not isinstance(value, (int, float)):
+        return None
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+_UPSERT_GAMES_SQL = """
+    insert into src_lichess.games (
+        username,
+        player_name,
+        game_id,
+        created_at_utc,
+        end_time_utc,
+        ingested_at_utc,
+        payload,
+        error
+    )
+    values ($1, $2, $3, $4, $5, $6, $7::jsonb, $8)
+    on conflict (username, game_id)
+    do update set
+        player_name = excluded.player_name,
+        created_at_utc = excluded.created_at_utc,
+        end_time_utc = excluded.end_time_utc,
+        ingested_at_utc = excluded.ingested_at_utc,
+        payload = excluded.payload,
+        error = excluded.error
+"""
+
+
+async def _upsert_rows(pool, rows: list[dict]) -> int:
+    if not rows:
+        return 0
+
+    await pool.executemany(
+        _UPSERT_GAMES_SQL,
+        [
+            (
+                r["username"],
+                r["player_name"],
+                r["game_id"],
+                r["created_at_utc"],
+                r["end_time_utc"],
+                r["ingested_at_utc"],
+                r["payload"],
+                r["error"],
+            )
+            for r in rows
+        ],
+    )
+
+    return len(rows)
+
+
+async def _stream_games(session, username: str, since: datetime | None):
+    """
+    Yields games from the lichess export endpoint one ndjson line at a time,
+    oldest first, so callers can commit in chunks and resume from a watermark.
+    """
+    params = {
+        "moves": "true",
+        "clocks": "true",
+        "opening": "true",
+        "lastFen": "true",
+        "ongoing": "true",
+        "sort": "dateAsc",
+    }
+    if since is not None:
+        params["since"] = str(int(since.timestamp() * 1000) + 1)
+
+    url = LICHESS_EXPORT_URL.format(username=username)
+
+    while True:
+        async with session.get(url, params=params) as resp:
+            if resp.status == 429:
+                await asyncio.sleep(RATE_LIMIT_WAIT_SECONDS)
+                continue
+            if resp.status == 404:
+                return
+            resp.raise_for_status()
+
+            async for line in resp.content:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+
+
+async def _ingest_player(
+    pool, session, player, ingested_at: datetime, lookback: timedelta, logger
+) -> int:
+    username = player.username
+    since = await _since_watermark(pool, username)
+    if since is not None:
+        since -= lookback
+
+    logger.info("ingest lichess username=%s since=%s", username, since)
+
+    upserted = 0
+    rows: list[dict] = []
+    ongoing: list[tuple] = []
+
+    async for g in _stream_games(session, username, since):
+        game_id = g.get("id")
+        if not game_id:
+            continue
+
+        if g.get("status") in ONGOING_STATUSES:
+            created_at = _ms_to_utc(g.get("createdAt"))
+            if created_at is not None:
+                ongoing.append((game_id, created_at))
+            continue
+
+        rows.append(
+            {
+                "username": username,
+                "player_name": player.player_name,
+                "game_id": game_id,
+                "created_at_utc": _ms_to_utc(g.get("createdAt")),
+                "end_time_utc": _ms_to_utc(g.get("lastMoveAt")),
+                "ingested_at_utc": ingested_at,
+                "payload": json.dumps(g),
+                "error": None,
+            }
+        )
+
+        if len(rows) >= CHUNK_SIZE:
+            upserted += await _upsert_rows(pool, rows)
+            rows = []
+
+    upserted += await _upsert_rows(pool, rows)
+    # only after the full export, an interrupted stream keeps the old set
+    await _replace_ongoing(pool, username, ongoing, ingested_at)
+    return upserted
+
+
+@asset(
+    key=AssetKey(["src_lichess", "games"]),
+    pool=LICHESS_API_POOL,
+    config_schema={
+        "usernames": Field([str], is_required=False),
+        "lookback_hours": Field(int, default_value=DEFAULT_LOOKBACK_HOURS),
+    },
+)
+def lichess_games(context) -> dict:
+    """
+    Incremental ingest for lichess games.
+    Streams each player's ndjson export from their `since` watermark and writes it
+    in chunks, so memory does not depend on how much history a player has.
+    Games still being played are listed in src_lichess.ongoing_games and hold the
+    watermark at their creation until they finish, however long they run;
+    `lookback_hours` re-reads a further margin before it.
+    """
+    logger = get_dagster_logger()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    target_usernames = set(context.op_config.get("usernames", []) or [])
+    players = [
+        p
+        for p in load_players_from_yaml("lichess")
+        if not target_usernames or p.username in target_usernames
+    ]
+
+    lookback = timedelta(hours=context.op_config["lookback_hours"])
+
+    async def ingest_all() -> dict:
+        ingested_at = utc_now()
+        summary = {
+            "players_seen": len(players),
+            "players_ingested": 0,
+            "games_upserted": 0,
+        }
+
+        headers = {
+            "Accept": "application/x-ndjson",
+            "User-Agent": os.getenv("LICHESS_USER_AGENT", DEFAULT_USER_AGENT),
+        }
+        token = os.getenv("LICHESS_API_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        # one export stream at a time, so a single connection serves it
+        pool = await asyncpg.create_pool(libpq_url(POSTGRES_URL), min_size=1, max_size=1)
+        try:
+            await pool.execute(_CREATE_ONGOING_SQL)
+            async with aiohttp.ClientSession(headers=headers, read_bufsize=READ_BUFSIZE) as session:
+                # lichess allows one export stream at a time per client
+                for p in players:
+                    try:
+                        upserted = await _ingest_player(
+                            pool, session, p, ingested_at, lookback, logger
+                        )
+                    except Exception as exc:
+                        logger.warning(
+                            "lichess export failed for username=%s: %s",
+                            p.username,
+                            exc,
+                        )
+                        continue
+
+                    summary["players_ingested"] += 1
+                    summary["games_upserted"] += upserted
+        finally:
+            await pool.close()
+
+        return summary
+
+    return asyncio.run(ingest_all())
+
+
+src_lichess_games_job = define_asset_job(
+    "src_lichess_games",
+    selection=AssetSelection.keys(AssetKey(["src_lichess", "games"])),
+    tags=LICHESS_INGEST_RUN_TAGS,
+)
+
+src_lichess_games_schedule = non_overlapping_schedule(
+    "src_lichess_games",
+    src_lichess_games_job,
+    "*/5 * * * *",
+    [AssetKey(["src_lichess", "games"])],
+)
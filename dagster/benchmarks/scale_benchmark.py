@@ -0,0 +1,199 @@
+"""
+Builds the dbt project over synthetic data at several scales and reports
+per-model runtime, table size and scaling exponent.
+
+    python -m benchmarks.scale_benchmark --scales 1 10 100 --players 5 --days 60
+
+Each scale regenerates the synthetic_* players (see benchmarks.synthetic) with
+players (default) or games per day multiplied by the scale, then runs
+`dbt run --full-refresh` over everything downstream of src_chesscom.
+The exponent is the log-log slope of runtime over input rows, ~1 is linear.
+Meant for a local Postgres without real players.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+from dataclasses import replace
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.synthetic import SyntheticConfig, generate, reset_synthetic
+from utilities.dbt_run_results import add_relation_stats, model_timings, scaling_exponent
+
+DBT_PROJECT_DIR = Path(__file__).resolve().parents[2] / "dbt"
+SOURCE_TABLES = [
+    "src_chesscom.game_payloads",
+    "src_chesscom.game_members",
+    "src_chesscom.player",
+    "src_chesscom.archives",
+]
+
+
+def _profiles_dir() -> Path | None:
+    env_dir = os.getenv("DBT_PROFILES_DIR")
+    if env_dir:
+        return Path(env_dir)
+    for candidate in (DBT_PROJECT_DIR / ".dbt", DBT_PROJECT_DIR.parent / ".dbt"):
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def real_rows(engine) -> int:
+    sql = text("""
+        select
+            (select count(*) from src_chesscom.game_members where username not like 'synthetic\\_%')
+            + (select count(*) from src_chesscom.player where username not like 'synthetic\\_%')
+    """)
+    with engine.connect() as conn:
+        return conn.execute(sql).scalar()
+
+
+def analyze(engine, relations: list[str]) -> None:
+    # fresh tables have no planner estimates until analyzed
+    with engine.begin() as conn:
+        for relation in relations:
+            conn.execute(text(f"analyze {relation}"))
+
+
+def dbt_run(select: str = "source:src_chesscom+") -> tuple[dict, dict]:
+    """`dbt run --full-refresh`, returns run_results.json and manifest.json."""
+    dbt = os.getenv("DBT_CLI_PATH") or os.getenv("DBT_EXECUTABLE") or "dbt"
+    args = [
+        dbt,
+        "run",
+        "--project-dir",
+        str(DBT_PROJECT_DIR),
+        "--full-refresh",
+        "--select",
+        select,
+    ]
+    profiles_dir = _profiles_dir()
+    if profiles_dir is not None:
+        args += ["--profiles-dir", str(profiles_dir)]
+
+    subprocess.run(args, check=True)
+
+    target = DBT_PROJECT_DIR / "target"
+    run_results = json.loads((target / "run_results.json").read_text(encoding="utf-8"))
+    manifest = json.loads((target / "manifest.json").read_text(encoding="utf-8"))
+    return run_results, manifest
+
+
+def run_benchmark(engine, base: SyntheticConfig, scales: list[int], scale_by: str) -> dict:
+    """Returns {"scales": {scale: {model: stats}}, "exponents": {model: exponent}}."""
+    results: dict[int, dict[str, dict]] = {}
+
+    for scale in scales:
+        if scale_by == "players":
+            config = replace(base, players=base.players * scale)
+        else:
+            config = replace(base, games_per_day=base.games_per_day * scale)
+
+        reset_synthetic(engine)
+        counts = generate(engine, config)
+        analyze(engine, SOURCE_TABLES)
+        print(f"scale={scale} generated {json.dumps(counts)}", flush=True)
+
+        run_results, manifest = dbt_run()
+        timings = model_timings(run_results, manifest)
+        analyze(engine, [t["relation_name"] for t in timings.values() if t["relation_name"]])
+        with engine.connect() as conn:
+            add_relation_stats(conn, timings)
+
+        results[scale] = {
+            unique_id.split(".")[-1]: {
+                "status": t["status"],
+                "seconds": round(t["execution_time"], 3),
+                "input_rows": t.get("input_rows"),
+                "relation_bytes": t.get("relation_bytes"),
+            }
+            for unique_id, t in timings.items()
+        }
+
+    models = sorted({model for by_model in results.values() for model in by_model})
+    exponents = {
+        model: scaling_exponent(
+            [
+                (by_model[model]["input_rows"], by_model[model]["seconds"])
+                for by_model in results.values()
+                if model in by_model
+            ],
+            min_points=2,
+        )
+        for model in models
+    }
+
+    return {"scales": results, "exponents": exponents}
+
+
+def _report(report: dict) -> str:
+    scales = list(report["scales"])
+    header = ["model"] + [f"x{s} s" for s in scales] + [f"x{s} MB" for s in scales] + ["exponent"]
+    lines = [header]
+    for model, exponent in report["exponents"].items():
+        by_scale = [report["scales"][s].get(model, {}) for s in scales]
+        lines.append(
+            [model]
+            + [f"{m.get('seconds', '-')}" for m in by_scale]
+            + [
+                f"{(m.get('relation_bytes') or 0) / 2**20:.1f}" if m else "-"
+                for m in by_scale
+            ]
+            + ["-" if exponent is None else f"{exponent:.2f}"]
+        )
+
+    widths = [max(len(str(row[i])) for row in lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)) for row in lines
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--scale-by", choices=["players", "games"], default="players")
+    parser.add_argument("--players", type=int, default=5)
+    parser.add_argument("--days", type=int, default=SyntheticConfig.days)
+    parser.add_argument("--games-per-day", type=float, default=SyntheticConfig.games_per_day)
+    parser.add_argument("--snapshot-minutes", type=int, default=SyntheticConfig.snapshot_minutes)
+    parser.add_argument("--seed", type=int, default=SyntheticConfig.seed)
+    parser.add_argument("--output", type=Path, help="also write the report as json")
+    parser.add_argument(
+        "--allow-real-data",
+        action="store_true",
+        help="run even though non-synthetic players exist (their rows are rebuilt too)",
+    )
+    args = parser.parse_args()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(POSTGRES_URL)
+    if not args.allow_real_data and real_rows(engine):
+        raise SystemExit(
+            "src_chesscom has non-synthetic rows, use an empty database or --allow-real-data."
+        )
+
+    base = SyntheticConfig(
+        players=args.players,
+        days=args.days,
+        games_per_day=args.games_per_day,
+        snapshot_minutes=args.snapshot_minutes,
+        seed=args.seed,
+    )
+    report = run_benchmark(engine, base, sorted(set(args.scales)), args.scale_by)
+    reset_synthetic(engine)
+
+    print(_report(report))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
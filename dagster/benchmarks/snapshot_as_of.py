@@ -0,0 +1,116 @@
+"""
+Times chesscom_player_snapshot's last-game lookup both ways at several scales:
+the original range join + max(end_dt) and the as-of lateral probe that replaced it.
+
+    python -m benchmarks.snapshot_as_of --scales 1 4 16 --days 30
+
+Scale multiplies games per day (snapshots stay on their cadence), so the range
+join grows with snapshots x games per player while the probe should stay linear.
+Both queries must return the same rows, the script fails otherwise.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from dataclasses import replace
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.scale_benchmark import SOURCE_TABLES, analyze, dbt_run, real_rows
+from benchmarks.synthetic import SyntheticConfig, generate, reset_synthetic
+from utilities.dbt_run_results import scaling_exponent
+
+_SNAPSHOTS = """
+    select username, cast(ingested_at_utc as timestamp) as ingested_dt
+    from src_chesscom.player
+    where username like 'synthetic\\_%'
+"""
+
+RANGE_JOIN_SQL = f"""
+    select count(*) as snapshots, sum(extract(epoch from last_game_dt)) as checksum
+    from (
+        select src.username, src.ingested_dt, max(games.end_dt) as last_game_dt
+        from ({_SNAPSHOTS}) as src
+        left join chesscom.games as games on
+            games.username = src.username
+            and games.end_dt <= src.ingested_dt
+        group by 1, 2
+    ) as lookups
+"""
+
+AS_OF_SQL = f"""
+    select count(*) as snapshots, sum(extract(epoch from last_game_dt)) as checksum
+    from ({_SNAPSHOTS}) as src
+    left join lateral (
+        select games.end_dt as last_game_dt
+        from chesscom.games as games
+        where games.username = src.username
+            and games.end_dt <= src.ingested_dt
+        order by games.end_dt desc
+        limit 1
+    ) as game on true
+"""
+
+
+def _timed(engine, sql: str) -> tuple[float, tuple]:
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        row = tuple(conn.execute(text(sql)).one())
+        return time.perf_counter() - started, row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--players", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--games-per-day", type=float, default=SyntheticConfig.games_per_day)
+    parser.add_argument("--seed", type=int, default=SyntheticConfig.seed)
+    args = parser.parse_args()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(POSTGRES_URL)
+    if real_rows(engine):
+        raise SystemExit("src_chesscom has non-synthetic rows, use an empty database.")
+
+    base = SyntheticConfig(
+        players=args.players, days=args.days, games_per_day=args.games_per_day, seed=args.seed
+    )
+    results = {}
+    for scale in sorted(set(args.scales)):
+        reset_synthetic(engine)
+        counts = generate(engine, replace(base, games_per_day=base.games_per_day * scale))
+        analyze(engine, SOURCE_TABLES)
+        # builds chesscom.games with its (username, end_dt) index
+        dbt_run("chesscom_games")
+        analyze(engine, ["chesscom.games"])
+
+        range_seconds, range_row = _timed(engine, RANGE_JOIN_SQL)
+        as_of_seconds, as_of_row = _timed(engine, AS_OF_SQL)
+        if range_row != as_of_row:
+            raise SystemExit(f"scale={scale} results differ: {range_row} != {as_of_row}")
+
+        results[scale] = {
+            "games": counts["members"],
+            "snapshots": counts["snapshots"],
+            "range_join_seconds": round(range_seconds, 3),
+            "as_of_seconds": round(as_of_seconds, 3),
+        }
+        print(json.dumps({"scale": scale, **results[scale]}), flush=True)
+
+    reset_synthetic(engine)
+
+    for method in ("range_join", "as_of"):
+        exponent = scaling_exponent(
+            [(r["games"], r[f"{method}_seconds"]) for r in results.values()], min_points=2
+        )
+        print(f"{method} exponent over games: {'-' if exponent is None else f'{exponent:.2f}'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+"""
+Synthetic src_chesscom.* data for load testing the dbt project.
+
+    python -m benchmarks.synthetic --players 20 --days 180 --games-per-day 15
+
+Writes games (payloads with parsed_pgn moves and clocks for every time class,
+daily included), player snapshots on a fixed cadence and archives for players
+named `synthetic_<n>`. Moves are random legal moves, replayed on
+utilities.chess_positions.Position, so the position index can hash every game.
+The window ends at today's midnight and game urls derive from the seed, a rerun
+with the same seed only inserts rows that are not there yet.
+Run from the `dagster/` directory against a local Postgres.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import csv
+import io
+import json
+import os
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from utilities.chess_positions import (
+    CASTLING_RIGHTS,
+    START_FEN,
+    TCN_ALPHABET,
+    TCN_PROMOTIONS,
+    Position,
+    packed_moves,
+)
+from utilities.utils import utc_now
+
+SYNTHETIC_PREFIX = "synthetic_"
+
+# time class -> (weight, time controls)
+TIME_CLASSES = {
+    "bullet": (0.20, ["60", "120+1"]),
+    "blitz": (0.45, ["180", "180+2", "300"]),
+    "rapid": (0.25, ["600", "600+5", "900+10"]),
+    "daily": (0.10, ["1/86400", "1/259200"]),
+}
+# games that end in a mate say so, every other decisive game ends one of these ways
+TERMINATIONS = ["won by resignation", "won on time", "game abandoned"]
+COPY_BATCH_GAMES = 5000
+
+KNIGHT_STEPS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+DIAGONALS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+LINES = ((1, 0), (-1, 0), (0, 1), (0, -1))
+# piece -> (file/rank steps, slides until blocked)
+PIECE_STEPS = {
+    "N": (KNIGHT_STEPS, False),
+    "B": (DIAGONALS, True),
+    "R": (LINES, True),
+    "Q": (DIAGONALS + LINES, True),
+    "K": (DIAGONALS + LINES, False),
+}
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    players: int = 10
+    days: int = 90
+    games_per_day: float = 10.0
+    snapshot_minutes: int = 5
+    seed: int = 0
+
+
+def synthetic_usernames(players: int) -> list[str]:
+    return [f"{SYNTHETIC_PREFIX}{i:04d}" for i in range(players)]
+
+
+def _square_name(square: int) -> str:
+    return "abcdefgh"[square % 8] + str(square // 8 + 1)
+
+
+def _targets(board: list, square: int, steps: tuple, slide: bool):
+    file_idx, rank_idx = square % 8, square // 8
+    for file_step, rank_step in steps:
+        f, r = file_idx + file_step, rank_idx + rank_step
+        while 0 <= f < 8 and 0 <= r < 8:
+            yield r * 8 + f
+            if not slide or board[r * 8 + f] is not None:
+                break
+            f += file_step
+            r += rank_step
+
+
+def _attacked(board: list, square: int, by_white: bool) -> bool:
+    queen = "Q" if by_white else "q"
+    for kind in "NBRK":
+        steps, slide = PIECE_STEPS[kind]
+        attacker = kind if by_white else kind.lower()
+        for target in _targets(board, square, steps, slide):
+            if board[target] == attacker or (slide and board[target] == queen):
+                return True
+
+    pawn_rank = square // 8 + (-1 if by_white else 1)
+    if 0 <= pawn_rank < 8:
+        pawn = "P" if by_white else "p"
+        for f in (square % 8 - 1, square % 8 + 1):
+            if 0 <= f < 8 and board[pawn_rank * 8 + f] == pawn:
+                return True
+    return False
+
+
+def _in_check(board: list, white: bool) -> bool:
+    return _attacked(board, board.index("K" if white else "k"), not white)
+
+
+def _pseudo_legal_moves(position: Position) -> list[tuple[int, int, str | None]]:
+    """Moves of the side to move that may still leave its king in check, pawns promote to queens."""
+    board = position.board
+    white = position.white_to_move
+    moves: list[tuple[int, int, str | None]] = []
+
+    for square, piece in enumerate(board):
+        if piece is None or piece.isupper() != white:
+            continue
+
+        if piece.upper() == "P":
+            forward = 8 if white else -8
+            one = square + forward
+            promotion = "q" if one // 8 in (0, 7) else None
+            if board[one] is None:
+                moves.append((square, one, promotion))
+                if square // 8 == (1 if white else 6) and board[one + forward] is None:
+                    moves.append((square, one + forward, None))
+            for f in (square % 8 - 1, square % 8 + 1):
+                if not 0 <= f < 8:
+                    continue
+                target = one - one % 8 + f
+                captured = board[target]
+                if target == position.ep_square or (captured is not None and captured.isupper() != white):
+                    moves.append((square, target, promotion))
+            continue
+
+        steps, slide = PIECE_STEPS[piece.upper()]
+        for target in _targets(board, square, steps, slide):
+            captured = board[target]
+            if captured is None or captured.isupper() != white:
+                moves.append((square, target, None))
+
+    # castling is only added when legal: not out of, through or into check
+    home = 4 if white else 60
+    rook = "R" if white else "r"
+    if board[home] == ("K" if white else "k") and not _attacked(board, home, not white):
+        for right, rook_square, between, king_path in (
+            ("K", home + 3, (home + 1, home + 2), (home + 1, home + 2)),
+            ("Q", home - 4, (home - 1, home - 2, home - 3), (home - 1, home - 2)),
+        ):
+            if (
+                (right if white else right.lower()) in position.castling
+                and board[rook_square] == rook
+                and all(board[s] is None for s in between)
+                and not any(_attacked(board, s, not white) for s in king_path)
+            ):
+                moves.append((home, king_path[-1], None))
+
+    return moves
+
+
+def _board_after(position: Position, move: tuple[int, int, str | None]) -> list:
+    """The board after a move, the same way Position.push plays it, without touching position."""
+    from_sq, to_sq, promotion = move
+    board = position.board[:]
+    piece = board[from_sq]
+
+    if piece.upper() == "P" and to_sq == position.ep_square and board[to_sq] is None and from_sq % 8 != to_sq % 8:
+        board[to_sq - 8 if piece.isupper() else to_sq + 8] = None
+    if piece.upper() == "K" and abs(to_sq - from_sq) == 2:
+        rook_from, rook_to = (from_sq + 3, from_sq + 1) if to_sq > from_sq else (from_sq - 4, from_sq - 1)
+        board[rook_to], board[rook_from] = board[rook_from], None
+
+    board[from_sq] = None
+    board[to_sq] = (promotion.upper() if piece.isupper() else promotion) if promotion else piece
+    return board
+
+
+def _is_legal(position: Position, move: tuple[int, int, str | None]) -> bool:
+    return not _in_check(_board_after(position, move), position.white_to_move)
+
+
+def _san(position: Position, move: tuple[int, int, str | None], pseudo_legal: list, after: list) -> str:
+    from_sq, to_sq, promotion = move
+    piece = position.board[from_sq]
+    kind = piece.upper()
+
+    if kind == "K" and abs(to_sq - from_sq) == 2:
+        san = "O-O" if to_sq > from_sq else "O-O-O"
+    elif kind == "P":
+        san = _square_name(to_sq)
+        if from_sq % 8 != to_sq % 8:
+            san = "abcdefgh"[from_sq % 8] + "x" + san
+        if promotion:
+            san += "=" + promotion.upper()
+    else:
+        # name the origin file, rank or both when another such piece could go there too
+        rivals = [
+            m[0]
+            for m in pseudo_legal
+            if m[1] == to_sq and m[0] != from_sq and position.board[m[0]] == piece and _is_legal(position, m)
+        ]
+        origin = ""
+        if rivals:
+            if all(r % 8 != from_sq % 8 for r in rivals):
+                origin = "abcdefgh"[from_sq % 8]
+            elif all(r // 8 != from_sq // 8 for r in rivals):
+                origin = str(from_sq // 8 + 1)
+            else:
+                origin = _square_name(from_sq)
+        capture = "x" if position.board[to_sq] is not None else ""
+        san = kind + origin + capture + _square_name(to_sq)
+
+    if _in_check(after, not position.white_to_move):
+        san += "+"
+    return san
+
+
+def _tcn(move: tuple[int, int, str | None]) -> str:
+    """The inverse of chess_positions.decode_tcn for one move."""
+    from_sq, to_sq, promotion = move
+    if promotion:
+        # promotions encode the piece and the file offset, see decode_tcn
+        to_sq = 64 + 3 * TCN_PROMOTIONS.index(promotion) + (to_sq % 8 - from_sq % 8) + 1
+    return TCN_ALPHABET[from_sq] + TCN_ALPHABET[to_sq]
+
+
+def _fen(position: Position, fullmove: int) -> str:
+    ranks = []
+    for rank_idx in range(7, -1, -1):
+        rank, empty = "", 0
+        for piece in position.board[rank_idx * 8 : rank_idx * 8 + 8]:
+            if piece is None:
+                empty += 1
+                continue
+            rank += (str(empty) if empty else "") + piece
+            empty = 0
+        ranks.append(rank + (str(empty) if empty else ""))
+
+    castling = "".join(c for c in CASTLING_RIGHTS if c in position.castling) or "-"
+    ep = "-" if position.ep_square is None else _square_name(position.ep_square)
+    # the halfmove clock is not tracked
+    return f"{'/'.join(ranks)} {'w' if position.white_to_move else 'b'} {castling} {ep} 0 {fullmove}"
+
+
+def _format_clock(seconds: float) -> str:
+    # chess.com pgn clocks, H:MM:SS.d (hours keep counting for daily games)
+    tenths = max(int(seconds * 10), 0)
+    minutes, tenth_seconds = divmod(tenths, 600)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{tenth_seconds // 10:02d}.{tenth_seconds % 10}"
+
+
+def _time_control_seconds(time_control: str) -> tuple[float, float]:
+    if "/" in time_control:
+        return float(time_control.split("/")[1]), 0.0
+    base, _, increment = time_control.partition("+")
+    return float(base), float(increment or 0)
+
+
+def _moves(rng: random.Random, time_control: str) -> tuple[dict, str, float, str | None, str]:
+    """
+    parsed_pgn style moves of a random legal game, its tcn, duration in seconds,
+    "checkmate"/"stalemate" when it ended on the board, and the final fen.
+    """
+    base, increment = _time_control_seconds(time_control)
+    daily = "/" in time_control
+    plies = rng.randint(16, 140)
+    clocks = {"white": base, "black": base}
+    # daily players use a fraction of their per-move allowance, live players ~1/40 of the base
+    average_think = base * 0.3 if daily else base / 40
+    rounds: dict[str, dict] = {}
+    tcn = []
+    elapsed = 0.0
+    position = Position()
+    outcome = None
+
+    for ply in range(plies):
+        pseudo_legal = _pseudo_legal_moves(position)
+        rng.shuffle(pseudo_legal)
+        move = next((m for m in pseudo_legal if _is_legal(position, m)), None)
+        if move is None:
+            outcome = "checkmate" if _in_check(position.board, position.white_to_move) else "stalemate"
+            if outcome == "checkmate":
+                last = rounds[str((ply - 1) // 2 + 1)]["black" if ply % 2 == 0 else "white"]
+                last["move"] = last["move"].rstrip("+") + "#"
+            break
+
+        color = "white" if ply % 2 == 0 else "black"
+        think = min(rng.expovariate(1 / average_think), clocks[color] - 0.1 if not daily else base)
+        elapsed += max(think, 0.1)
+        clocks[color] = base - think if daily else max(clocks[color] - think, 0.1) + increment
+
+        rounds.setdefault(str(ply // 2 + 1), {})[color] = {
+            "move": _san(position, move, pseudo_legal, _board_after(position, move)),
+            "clock": _format_clock(clocks[color]),
+        }
+        tcn.append(_tcn(move))
+        position.push(*move)
+
+    return rounds, "".join(tcn), elapsed, outcome, _fen(position, len(tcn) // 2 + 1)
+
+
+def _pgn(headers: dict, rounds: dict) -> str:
+    lines = [f'[{key} "{value}"]' for key, value in headers.items()]
+    moves = []
+    for key, plies in rounds.items():
+        for color, ply in plies.items():
+            prefix = f"{key}. " if color == "white" else f"{key}... "
+            moves.append(f"{prefix}{ply['move']} {{[%clk {ply['clock']}]}}")
+    return "\n".join(lines) + "\n\n" + " ".join(moves) + f" {headers['Result']}"
+
+
+def _game(
+    rng: random.Random,
+    game_id: int,
+    white: str,
+    black: str,
+    ratings: dict[str, int],
+    start: datetime,
+) -> tuple[dict, datetime]:
+    time_class = rng.choices(list(TIME_CLASSES), weights=[w for w, _ in TIME_CLASSES.values()])[0]
+    time_control = rng.choice(TIME_CLASSES[time_class][1])
+    daily = time_class == "daily"
+    rounds, tcn, duration, outcome, fen = _moves(rng, time_control)
+    end = start + timedelta(seconds=duration)
+
+    if outcome == "checkmate":
+        # the side that made the last move mated
+        result = "1-0" if len(tcn) // 2 % 2 == 1 else "0-1"
+        termination = "won by checkmate"
+    elif outcome == "stalemate":
+        result = "1/2-1/2"
+    else:
+        result = rng.choice(["1-0", "0-1", "1/2-1/2"])
+        termination = rng.choice(TERMINATIONS)
+    winner = {"1-0": white, "0-1": black}.get(result)
+    headers = {
+        "Event": "Let's Play!" if daily else "Live Chess",
+        "Site": "Chess.com",
+        "Date": start.strftime("%Y.%m.%d"),
+        "White": white,
+        "Black": black,
+        "Result": result,
+        "WhiteElo": ratings[white],
+        "BlackElo": ratings[black],
+        "TimeControl": time_control,
+        "Termination": (
+            f"{winner} {termination}"
+            if winner
+            else "Game drawn by stalemate" if outcome == "stalemate" else "Game drawn by agreement"
+        ),
+        "StartTime": start.strftime("%H:%M:%S"),
+        "EndTime": end.strftime("%H:%M:%S"),
+        "CurrentPosition": fen,
+    }
+
+    game = {
+        "url": f"https://www.chess.com/game/{'daily' if daily else 'live'}/{game_id}",
+        "pgn": _pgn(headers, rounds),
+        "time_control": time_control,
+        "end_time": int(end.timestamp()),
+        "rated": rng.random() < 0.9,
+        "tcn": tcn,
+        "uuid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "initial_setup": START_FEN,
+        "fen": fen,
+        "time_class": time_class,
+        "rules": "chess",
+        "eco": "https://www.chess.com/openings/Kings-Pawn-Opening",
+        "white": {"rating": ratings[white], "result": "win" if winner == white else "lose", "username": white},
+        "black": {"rating": ratings[black], "result": "win" if winner == black else "lose", "username": black},
+        "parsed_pgn": {"headers": headers, "moves": rounds, "result": result},
+    }
+    if daily:
+        game["start_time"] = int(start.timestamp())
+    if rng.random() < 0.3:
+        game["accuracies"] = {"white": round(rng.uniform(50, 99), 2), "black": round(rng.uniform(50, 99), 2)}
+
+    for player in (white, black):
+        ratings[player] += rng.randint(-8, 8)
+
+    return game, end
+
+
+def _pg_array(values: list | None) -> str | None:
+    if values is None:
+        return None
+    return "{" + ",".join("NULL" if v is None else f'"{v}"' for v in values) + "}"
+
+
+# snapshots and archives have no unique key, a fetch is (method, username, ingested_at_utc)
+_NEW_FETCHES = """
+    where not exists (
+        select 1 from {table} as t
+        where t.method = stage.method
+            and t.username = stage.username
+            and t.ingested_at_utc = stage.ingested_at_utc
+    )
+"""
+
+
+def _copy(raw_conn, table: str, columns: list[str], rows: list[tuple], new_rows: str = "on conflict do nothing") -> int:
+    """COPYs rows into a staging table, inserts the new ones into table and returns how many."""
+    column_list = ", ".join(columns)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with raw_conn.cursor() as cur:
+        cur.execute(f"create temp table synthetic_stage as select {column_list} from {table} with no data")
+        cur.copy_expert(f"copy synthetic_stage ({column_list}) from stdin with (format csv)", buffer)
+        cur.execute(
+            f"insert into {table} ({column_list}) select {column_list} from synthetic_stage as stage "
+            + new_rows.format(table=table)
+        )
+        inserted = cur.rowcount
+        cur.execute("drop table synthetic_stage")
+    return inserted
+
+
+def reset_synthetic(engine) -> None:
+    """Removes every synthetic_* player's rows, real players are never touched."""
+    statements = [
+        """
+        with removed as (
+            delete from src_chesscom.game_members
+            where username like 'synthetic\\_%'
+            returning game_url
+        )
+        delete from src_chesscom.game_payloads
+        where game_url in (select game_url from removed)
+        """,
+        "delete from src_chesscom.player where username like 'synthetic\\_%'",
+        "delete from src_chesscom.archives where username like 'synthetic\\_%'",
+    ]
+    with engine.begin() as conn:
+        for stmt in statements:
+            conn.execute(text(stmt))
+
+
+def generate(engine, config: SyntheticConfig) -> dict[str, int]:
+    """Writes synthetic games, snapshots and archives, returns the rows inserted."""
+    rng = random.Random(config.seed)
+    usernames = synthetic_usernames(config.players)
+    ratings = {u: rng.randint(600, 2200) for u in usernames}
+    # a fixed end per day keeps snapshot times (and so reruns) the same
+    end = utc_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=config.days)
+    ingested_at = utc_now()
+    counts = {"games": 0, "members": 0, "snapshots": 0, "archives": 0}
+    game_ends: dict[str, list[datetime]] = {u: [] for u in usernames}
+
+    payload_rows: list[tuple] = []
+    member_rows: list[tuple] = []
+    next_game_id = 9_000_000_000_000 + config.seed * 10_000_000_000
+
+    raw_conn = engine.raw_connection()
+    try:
+        def flush() -> None:
+            counts["games"] += _copy(
+                raw_conn,
+                "src_chesscom.game_payloads",
+                ["game_url", "uuid", "stored_at_utc", "payload", "move_san", "clock_ds", "move_from", "move_to", "move_promo"],
+                payload_rows,
+            )
+            counts["members"] += _copy(
+                raw_conn,
+                "src_chesscom.game_members",
+                ["username", "player_name", "game_url", "color", "end_time_utc", "ingested_at_utc", "error"],
+                member_rows,
+            )
+            raw_conn.commit()
+            payload_rows.clear()
+            member_rows.clear()
+
+        for day in range(config.days):
+            day_start = start + timedelta(days=day)
+            for username in usernames:
+                games_today = rng.randint(0, max(int(config.games_per_day * 2), 0))
+                clock = day_start + timedelta(hours=rng.uniform(6, 20))
+
+                for _ in range(games_today):
+                    # mostly strangers, sometimes another tracked player (one shared payload)
+                    if config.players > 1 and rng.random() < 0.05:
+                        opponent = rng.choice([u for u in usernames if u != username])
+                    else:
+                        opponent = f"opponent_{rng.randint(0, 99_999)}"
+                        ratings.setdefault(opponent, rng.randint(600, 2200))
+                    white, black = (username, opponent) if rng.random() < 0.5 else (opponent, username)
+
+                    game, game_end = _game(rng, next_game_id, white, black, ratings, clock)
+                    next_game_id += 1
+                    # a short break between live games keeps them in the same session most of the time,
+                    # daily games run in the background
+                    if game["time_class"] != "daily":
+                        clock = game_end + timedelta(seconds=rng.expovariate(1 / 240))
+
+                    packed = packed_moves(game)
+                    payload_rows.append(
+                        (
+                            game["url"],
+                            game["uuid"],
+                            ingested_at,
+                            json.dumps(game),
+                            _pg_array(packed["move_san"]),
+                            _pg_array(packed["clock_ds"]),
+                            _pg_array(packed["move_from"]),
+                            _pg_array(packed["move_to"]),
+                            _pg_array(packed["move_promo"]),
+                        )
+                    )
+
+                    for player in (white, black):
+                        if player not in game_ends:
+                            continue
+                        member_rows.append(
+                            (player, None, game["url"], "white" if player == white else "black", game_end, ingested_at, None)
+                        )
+                        game_ends[player].append(game_end)
+
+                if len(payload_rows) >= COPY_BATCH_GAMES:
+                    flush()
+
+        flush()
+
+        snapshot_rows: list[tuple] = []
+        archive_rows: list[tuple] = []
+        for i, username in enumerate(usernames):
+            ends = sorted(game_ends[username])
+            joined = int((start - timedelta(days=rng.randint(30, 2000))).timestamp())
+            snapshot_at = start
+            while snapshot_at <= end:
+                last_game = bisect.bisect_right(ends, snapshot_at)
+                last_online = ends[last_game - 1] if last_game else start
+                payload = {
+                    "player_id": 100_000 + i,
+                    "@id": f"https://api.chess.com/pub/player/{username}",
+                    "url": f"https://www.chess.com/member/{username}",
+                    "name": username,
+                    "username": username,
+                    "avatar": None,
+                    "followers": rng.randint(0, 200),
+                    "country": "https://api.chess.com/pub/country/US",
+                    "last_online": int(last_online.timestamp()),
+                    "joined": joined,
+                    "status": "basic",
+                    "is_streamer": False,
+                    "verified": False,
+                    "league": rng.choice(["Wood", "Stone", "Bronze", "Silver"]),
+                    "streaming_platforms": [],
+                }
+                snapshot_rows.append(("get_player", username, snapshot_at, json.dumps(payload), None))
+                snapshot_at += timedelta(minutes=config.snapshot_minutes)
+
+            months = sorted({d.strftime("%Y/%m") for d in ends})
+            archives = [f"https://api.chess.com/pub/player/{username}/games/{m}" for m in months]
+            archive_rows.append(("get_archives", username, end, json.dumps({"archives": archives}), None))
+
+            if len(snapshot_rows) >= COPY_BATCH_GAMES * 10 or i == len(usernames) - 1:
+                counts["snapshots"] += _copy(
+                    raw_conn,
+                    "src_chesscom.player",
+                    ["method", "username", "ingested_at_utc", "payload", "error"],
+                    snapshot_rows,
+                    _NEW_FETCHES,
+                )
+                raw_conn.commit()
+                snapshot_rows.clear()
+
+        counts["archives"] = _copy(
+            raw_conn,
+            "src_chesscom.archives",
+            ["method", "username", "ingested_at_utc", "payload", "error"],
+            archive_rows,
+            _NEW_FETCHES,
+        )
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=SyntheticConfig.players)
+    parser.add_argument("--days", type=int, default=SyntheticConfig.days)
+    parser.add_argument("--games-per-day", type=float, default=SyntheticConfig.games_per_day)
+    parser.add_argument("--snapshot-minutes", type=int, default=SyntheticConfig.snapshot_minutes)
+    parser.add_argument("--seed", type=int, default=SyntheticConfig.seed)
+    parser.add_argument("--reset", action="store_true", help="delete existing synthetic_* rows first")
+    args = parser.parse_args()
+
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    engine = create_engine(POSTGRES_URL)
+    if args.reset:
+        reset_synthetic(engine)
+
+    counts = generate(
+        engine,
+        SyntheticConfig(
+            players=args.players,
+            days=args.days,
+            games_per_day=args.games_per_day,
+            snapshot_minutes=args.snapshot_minutes,
+            seed=args.seed,
+        ),
+    )
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
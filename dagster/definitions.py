@@ -17,14 +17,27 @@ _src_dir = str(Path(__file__).parent)
 if _src_dir not in sys.path:
     sys.path.insert(0, _src_dir)
 
+from assets import analytics_export as analytics_export_assets
 from assets import src_chesscom_admin as chesscom_admin_assets
 from assets import src_chesscom_player as chesscom_player_assets
 from assets import src_chesscom_games as chesscom_games_assets
+from assets import src_chesscom_positions as chesscom_positions_assets
+from assets import src_lichess_games as lichess_games_assets
 from assets.dbt import dbt_assets, dbt_resource
+from sensors.read_api import read_api_cache_invalidation_sensor
+from sensors.run_queue import run_queue_metrics_sensor
 from sensors.src_chesscom import src_chesscom_games_job, chesscom_new_games_sensor
+from utilities.run_coordination import POSTGRES_WRITER_RUN_TAGS
 
 all_assets = load_assets_from_modules(
-    [chesscom_admin_assets, chesscom_player_assets, chesscom_games_assets]
+    [
+        chesscom_admin_assets,
+        chesscom_player_assets,
+        chesscom_games_assets,
+        chesscom_positions_assets,
+        lichess_games_assets,
+        analytics_export_assets,
+    ]
 )
 
 assets = [*all_assets, dbt_assets]
@@ -33,14 +46,26 @@ automation_condition_sensor = AutomationConditionSensorDefinition(
     target=AssetSelection.all(),
     default_status=DefaultSensorStatus.RUNNING,
     minimum_interval_seconds=60 * 5,
+    run_tags=POSTGRES_WRITER_RUN_TAGS,
 )
-sensors = [automation_condition_sensor, chesscom_new_games_sensor]
+sensors = [
+    automation_condition_sensor,
+    chesscom_new_games_sensor,
+    run_queue_metrics_sensor,
+    read_api_cache_invalidation_sensor,
+]
 jobs = [
     src_chesscom_games_job,
     chesscom_player_assets.src_chesscom_player_job,
     chesscom_admin_assets.src_chesscom_swap,
+    lichess_games_assets.src_lichess_games_job,
+    analytics_export_assets.analytics_export_job,
+]
+schedules = [
+    chesscom_player_assets.src_chesscom_schedule,
+    lichess_games_assets.src_lichess_games_schedule,
+    analytics_export_assets.analytics_export_schedule,
 ]
-schedules = [chesscom_player_assets.src_chesscom_schedule]
 resources = {"dbt": dbt_resource}
 
 defs = Definitions(
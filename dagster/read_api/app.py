@@ -0,0 +1,280 @@
+"""
+Read service for current chess.com player snapshots, ratings and latest games,
+served from an in-memory LRU/TTL cache so consumers stay off Postgres.
+
+    uvicorn read_api.app:app --port 8010    (from dagster/)
+
+The cache is warmed for every configured player on startup. The
+`read_api_cache_invalidation` sensor POSTs materialized asset keys to
+/invalidate, which reloads the affected entries in the background while the
+previous values keep being served. Usernames outside the roster are looked up
+but a miss is never cached, so unknown names cannot crowd out roster entries.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from read_api.cache import LatencyWindow, TTLCache
+from utilities.utils import libpq_url, load_players_from_yaml
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = float(os.getenv("READ_API_TTL_SECONDS", 15 * 60))
+CACHE_MAX_ENTRIES = int(os.getenv("READ_API_CACHE_ENTRIES", 10_000))
+MAX_GAMES = 50
+DEFAULT_GAMES = 10
+RATING_KEYS = ["chess_bullet", "chess_blitz", "chess_rapid", "chess_daily", "fide"]
+
+# asset key (user string) -> cache kinds it feeds
+ASSET_KINDS = {
+    "chesscom/player": ["player"],
+    "src_chesscom/player_stats": ["ratings"],
+    "chesscom/games": ["games"],
+}
+
+GAME_COLUMNS = """
+    game_url, uuid, time_class, time_control, rated, rules, result, termination,
+    white_username, black_username, white_elo, black_elo, eco, start_dt, end_dt
+"""
+
+PLAYER_SQL = "select * from chesscom.player where username = any($1::text[])"
+
+RATINGS_SQL = """
+    select distinct on (username) username, ingested_at_utc, payload
+    from src_chesscom.player_stats
+    where method = 'get_player_stats'
+        and payload is not null
+        and username = any($1::text[])
+    order by username, ingested_at_utc desc
+"""
+
+# one index probe per username on chesscom.games (username, end_dt)
+GAMES_SQL = f"""
+    select u.username, latest.*
+    from unnest($1::text[]) as u(username)
+    cross join lateral (
+        select {GAME_COLUMNS}
+        from chesscom.games
+        where games.username = u.username
+        order by games.end_dt desc
+        limit {MAX_GAMES}
+    ) as latest
+"""
+
+
+class _JSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        # timestamps and numerics straight from asyncpg
+        return json.dumps(content, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def _ratings(payload) -> dict:
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    ratings = {}
+    for key in RATING_KEYS:
+        value = (payload or {}).get(key)
+        if isinstance(value, dict):
+            value = (value.get("last") or {}).get("rating")
+        if value is not None:
+            ratings[key] = value
+    return ratings
+
+
+def _roster() -> set[str]:
+    return {p.username for p in load_players_from_yaml("chesscom") if p.username}
+
+
+class ReadStore:
+    """Cache-fronted reads, each kind keyed by (kind, username)."""
+
+    def __init__(self, pool, cache: TTLCache):
+        self.pool = pool
+        self.cache = cache
+        self.roster = _roster()
+        self._refreshes: set[asyncio.Task] = set()
+
+    async def _load(self, kind: str, usernames: list[str]) -> dict[str, object]:
+        if kind == "player":
+            rows = await self.pool.fetch(PLAYER_SQL, usernames)
+            return {row["username"]: dict(row) for row in rows}
+        if kind == "ratings":
+            rows = await self.pool.fetch(RATINGS_SQL, usernames)
+            return {
+                row["username"]: {
+                    "ingested_at_utc": row["ingested_at_utc"],
+                    "ratings": _ratings(row["payload"]),
+                }
+                for row in rows
+            }
+
+        rows = await self.pool.fetch(GAMES_SQL, usernames)
+        games: dict[str, list[dict]] = {username: [] for username in usernames}
+        for row in rows:
+            game = dict(row)
+            games[game.pop("username")].append(game)
+        return games
+
+    async def get(self, kind: str, username: str):
+        async def loader():
+            return (await self._load(kind, [username])).get(username)
+
+        return await self.cache.get(
+            (kind, username), loader, cache_none=username in self.roster
+        )
+
+    async def warm(self, kinds: list[str], usernames: list[str] | None = None) -> dict[str, int]:
+        """
+        Batch-load and replace entries, the old values stay readable until then.
+        Without usernames the roster is reloaded and warmed, cached players
+        outside it are dropped and reloaded on their next request.
+        """
+        if usernames is None:
+            self.roster = _roster()
+            usernames = sorted(self.roster)
+            self.cache.invalidate(lambda key: key[0] in kinds and key[1] not in self.roster)
+        loaded = {}
+        for kind in kinds:
+            values = await self._load(kind, usernames) if usernames else {}
+            for username in usernames:
+                self.cache.put((kind, username), values.get(username))
+            loaded[kind] = len(values)
+        return loaded
+
+    def refresh(self, kinds: list[str]) -> None:
+        task = asyncio.create_task(self.warm(kinds))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Task) -> None:
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("cache refresh failed", exc_info=task.exception())
+
+
+async def player(request: Request):
+    store: ReadStore = request.app.state.store
+    username = request.path_params["username"]
+    snapshot, ratings = await asyncio.gather(
+        store.get("player", username), store.get("ratings", username)
+    )
+    if snapshot is None and ratings is None:
+        return _JSONResponse({"error": f"unknown player {username}"}, status_code=404)
+    return _JSONResponse({"username": username, "snapshot": snapshot, **(ratings or {})})
+
+
+async def games(request: Request):
+    store: ReadStore = request.app.state.store
+    username = request.path_params["username"]
+    try:
+        limit = min(int(request.query_params.get("limit", DEFAULT_GAMES)), MAX_GAMES)
+    except ValueError:
+        return _JSONResponse({"error": "limit must be an integer"}, status_code=400)
+
+    latest = await store.get("games", username) or []
+    return _JSONResponse({"username": username, "games": latest[: max(limit, 0)]})
+
+
+async def invalidate(request: Request):
+    token = os.getenv("READ_API_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        return _JSONResponse({"error": "unauthorized"}, status_code=401)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        return _JSONResponse({"error": "body must be JSON"}, status_code=400)
+    assets = body.get("assets", []) if isinstance(body, dict) else None
+    if not isinstance(assets, list) or not all(isinstance(key, str) for key in assets):
+        return _JSONResponse(
+            {"error": "body must be an object with an `assets` list of asset keys"},
+            status_code=400,
+        )
+
+    kinds = sorted({kind for key in assets for kind in ASSET_KINDS.get(key, [])})
+    request.app.state.store.refresh(kinds)
+    return _JSONResponse({"refreshing": kinds}, status_code=202)
+
+
+async def metrics(request: Request):
+    return _JSONResponse(
+        {
+            "latency": request.app.state.latency.percentiles(),
+            "cache": request.app.state.store.cache.stats(),
+        }
+    )
+
+
+async def health(request: Request):
+    return _JSONResponse({"status": "ok", "warmed": request.app.state.warmed})
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    POSTGRES_URL = os.getenv("POSTGRES_URL")
+    if not POSTGRES_URL:
+        raise ValueError("Missing env var POSTGRES_URL")
+
+    pool = await asyncpg.create_pool(libpq_url(POSTGRES_URL), min_size=1, max_size=4)
+    app.state.store = ReadStore(pool, TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS))
+    app.state.latency = LatencyWindow()
+    app.state.warmed = await app.state.store.warm(["player", "ratings", "games"])
+    try:
+        yield
+    finally:
+        await pool.close()
+
+
+class _LatencyMiddleware:
+    """Times /players requests into the latency window, adds a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", f"app;dur={elapsed_ms:.3f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if scope["path"].startswith("/players/"):
+                scope["app"].state.latency.record(time.perf_counter() - started)
+
+
+app = Starlette(
+    routes=[
+        Route("/players/{username}", player),
+        Route("/players/{username}/games", games),
+        Route("/invalidate", invalidate, methods=["POST"]),
+        Route("/metrics", metrics),
+        Route("/health", health),
+    ],
+    middleware=[Middleware(_LatencyMiddleware)],
+    lifespan=lifespan,
+)
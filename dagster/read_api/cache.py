@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class TTLCache:
+    """
+    LRU cache with a per-entry TTL. Concurrent misses on the same key share one
+    load, and `put` replaces entries in place so a refresh never leaves a gap.
+    `get(..., cache_none=False)` loads without storing a None result.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def keys(self) -> list[Hashable]:
+        return list(self._entries)
+
+    async def get(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]], cache_none: bool = True
+    ) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        if key not in self._loading:
+            self._loading[key] = asyncio.ensure_future(self._load(key, loader, cache_none))
+        # shielded so one cancelled request does not cancel the load for the others
+        return await asyncio.shield(self._loading[key])
+
+    async def _load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]], cache_none: bool
+    ) -> Any:
+        try:
+            value = await loader()
+            if value is not None or cache_none:
+                self.put(key, value)
+            return value
+        finally:
+            self._loading.pop(key, None)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LatencyWindow:
+    """Last `size` request durations, reported as millisecond percentiles."""
+
+    def __init__(self, size: int = 10_000):
+        self._samples: deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentiles(self) -> dict[str, float | int | None]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"requests": self.count, "p50_ms": None, "p99_ms": None, "max_ms": None}
+
+        def pct(p: float) -> float:
+            # nearest-rank
+            index = max(0, min(len(samples) - 1, int(-(-p * len(samples) // 100)) - 1))
+            return round(samples[index] * 1000, 3)
+
+        return {
+            "requests": self.count,
+            "window": len(samples),
+            "p50_ms": pct(50),
+            "p99_ms": pct(99),
+            "max_ms": round(samples[-1] * 1000, 3),
+        }
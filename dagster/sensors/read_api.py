@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+import os
+import urllib.error
+import urllib.request
+
+from dagster import AssetKey, DefaultSensorStatus, SkipReason, multi_asset_sensor
+
+# assets the read API caches, see read_api.app.ASSET_KINDS
+READ_API_ASSET_KEYS = [
+    AssetKey(["chesscom", "player"]),
+    AssetKey(["src_chesscom", "player_stats"]),
+    AssetKey(["chesscom", "games"]),
+]
+REQUEST_TIMEOUT_SECONDS = 5
+
+
+def _post_invalidate(base_url: str, asset_keys: list[str]) -> dict:
+    request = urllib.request.Request(
+        f"{base_url.rstrip('/')}/invalidate",
+        data=json.dumps({"assets": asset_keys}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    token = os.getenv("READ_API_TOKEN")
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read() or b"{}")
+
+
+@multi_asset_sensor(
+    name="read_api_cache_invalidation",
+    monitored_assets=READ_API_ASSET_KEYS,
+    minimum_interval_seconds=30,
+    default_status=DefaultSensorStatus.RUNNING,
+)
+def read_api_cache_invalidation_sensor(context):
+    """
+    Never requests runs, tells the read API (READ_API_URL) which cached assets
+    were materialized so it reloads them. Cursors only advance once the POST
+    succeeds, an unreachable API gets the same keys on the next tick.
+    """
+    base_url = os.getenv("READ_API_URL")
+    if not base_url:
+        return SkipReason("READ_API_URL not set.")
+
+    records = context.latest_materialization_records_by_key()
+    changed = sorted(key.to_user_string() for key, record in records.items() if record)
+    if not changed:
+        return SkipReason("No new materializations.")
+
+    try:
+        response = _post_invalidate(base_url, changed)
+    except (urllib.error.URLError, OSError) as exc:
+        context.log.warning("read API invalidation failed for %s: %s", changed, exc)
+        return SkipReason(f"Read API unreachable: {exc}")
+
+    context.advance_all_cursors()
+    return SkipReason(f"Invalidated {changed}, refreshing {response.get('refreshing')}.")
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import json
+
+from dagster import DefaultSensorStatus, SkipReason, sensor
+
+from utilities.run_coordination import queue_depth
+
+
+@sensor(
+    name="run_queue_metrics",
+    minimum_interval_seconds=60,
+    default_status=DefaultSensorStatus.RUNNING,
+)
+def run_queue_metrics_sensor(context):
+    """
+    Never requests runs, reports queue depth every minute: runs per unfinished
+    status and claimed/pending slots per concurrency pool, in the tick log and
+    as the tick's skip reason.
+    """
+    depth = queue_depth(context.instance)
+    context.log.info("run queue depth %s", depth)
+    return SkipReason(json.dumps(depth, sort_keys=True))
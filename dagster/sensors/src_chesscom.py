@@ -1,154 +1,329 @@
 from __future__ import annotations
 
-import asyncio
+import json
 import os
-from datetime import datetime, timezone, timedelta
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
 import aiohttp
 from sqlalchemy import create_engine, text
-from sqlalchemy.exc import ProgrammingError
 from dagster import (
     AssetKey,
     AssetSelection,
+    DagsterRunStatus,
     DefaultSensorStatus,
     RunRequest,
+    RunsFilter,
     SkipReason,
     define_asset_job,
     sensor,
 )
 
-from chess_guru import ChesscomAPI
+from utilities.profiling import profiled, run_async
+from utilities.run_coordination import CHESSCOM_INGEST_RUN_TAGS
 from utilities.utils import load_chess_players, utc_now
 
+CHESSCOM_ARCHIVE_URL = "https://api.chess.com/pub/player/{username}/games/{month}"
+DEFAULT_USER_AGENT = "chess-guru (chess.com API)"
+# the cursor is trusted between reconciles, runs failing forces an earlier one
+RECONCILE_INTERVAL_SECONDS = 60 * 60
+FINISHED_STATUSES = [
+    DagsterRunStatus.SUCCESS,
+    DagsterRunStatus.FAILURE,
+    DagsterRunStatus.CANCELED,
+]
+
 
 def _load_players_from_yaml():
     yml_path = Path(__file__).resolve().parents[1] / "assets" / "asset_definitions" / "chess_players.yml"
-    return load_chess_players(yml_path)
+    return [p for p in load_chess_players(yml_path) if p.online_platform == "chesscom"]
+
+
+def _load_cursor(cursor: str | None) -> dict:
+    """
+    Sensor state kept in the dagster cursor:
+        watermarks: username -> latest ingested end_time (epoch seconds)
+        etags: username -> {archive month: ETag of the last probe}
+        requested: username -> epoch seconds a run was requested at
+        attempts: username -> requested runs that did not succeed, part of the
+            run_key so a failed window is requested again instead of deduplicated
+        backfills: username -> epoch seconds the full-history run was requested,
+            afterwards players without games are probed like everyone else
+        reconciled_at / ticked_at: epoch seconds
+    """
+    state = {
+        "reconciled_at": None,
+        "ticked_at": None,
+        "watermarks": {},
+        "etags": {},
+        "requested": {},
+        "attempts": {},
+        "backfills": {},
+    }
+    if cursor:
+        state.update(json.loads(cursor))
+    return state
 
 
-def _latest_end_time_utc(engine, username: str) -> datetime | None:
+def _latest_end_times(engine, usernames: list[str]) -> dict[str, int | None] | None:
+    """One round trip for all players, None while the ingest tables do not exist yet."""
+    exists_sql = text("select to_regclass('src_chesscom.game_members') is not null")
     sql = text("""
-        select max(end_time_utc) as max_end_time
-        from src_chesscom.games
-        where username = :username
+        select username, extract(epoch from max(end_time_utc))::bigint as max_end_time
+        from src_chesscom.game_members
+        where username = any(:usernames)
+        group by username
     """)
 
-    try:
-        with engine.connect() as conn:
-            row = conn.execute(sql, {"username": username}).first()
-            return row[0] if row and row[0] is not None else None
-    except ProgrammingError as exc:
-        if "src_chesscom.games" in str(exc):
+    with engine.connect() as conn:
+        if not conn.execute(exists_sql).scalar():
             return None
-        raise
+        found = dict(conn.execute(sql, {"usernames": usernames}).all())
+
+    return {username: found.get(username) for username in usernames}
+
+
+def _settle_requested(instance, state: dict) -> bool:
+    """
+    Drops players whose requested run has finished and returns True when the
+    cursor needs a reconcile: a run did not succeed (the advanced watermark is
+    not in the db) or a backfill finished (the watermark is only known there).
+    A failed run counts an attempt and forgets the player's ETags, otherwise the
+    archive it failed to ingest would answer 304 and never be requested again.
+    """
+    requested = state["requested"]
+    updated_after = datetime.fromtimestamp(min(requested.values()), tz=timezone.utc)
+    records = instance.get_run_records(
+        filters=RunsFilter(
+            job_name=src_chesscom_games_job.name,
+            statuses=FINISHED_STATUSES,
+            updated_after=updated_after,
+        )
+    )
+
+    reconcile = False
+    for record in records:
+        username = record.dagster_run.tags.get("username")
+        if username not in requested or record.create_timestamp.timestamp() < requested[username]:
+            continue
+        requested.pop(username)
+        failed = record.dagster_run.status != DagsterRunStatus.SUCCESS
+        if failed:
+            state["attempts"][username] = state["attempts"].get(username, 0) + 1
+            state["etags"].pop(username, None)
+            # a failed full-history run is requested again
+            state["backfills"].pop(username, None)
+        reconcile = reconcile or failed or state["watermarks"].get(username) is None
+
+    return reconcile
+
 
+def _archive_month(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y/%m")
 
-def _extract_games(payload: dict) -> list[dict]:
-    out: list[dict] = []
-    months = payload.get("months", {}) or {}
 
-    for _, month_obj in months.items():
-        out.extend(month_obj.get("games", []) or [])
+async def _probe_archive_month(
+    session, username: str, month: str, etag: str | None
+) -> tuple[list[dict] | None, str | None]:
+    """Conditional GET of a monthly archive, (None, etag) when it has not changed."""
+    url = CHESSCOM_ARCHIVE_URL.format(username=username.lower(), month=month)
+    headers = {"If-None-Match": etag} if etag else {}
 
-    return out
+    async with session.get(url, headers=headers) as resp:
+        if resp.status == 304:
+            return None, etag
+        if resp.status == 404:
+            return [], None
+        resp.raise_for_status()
+        payload = await resp.json()
+        return payload.get("games", []) or [], resp.headers.get("ETag")
 
 
 src_chesscom_games_job = define_asset_job(
     "src_chesscom_games",
     selection=AssetSelection.keys(AssetKey(["src_chesscom", "games"])),
+    tags=CHESSCOM_INGEST_RUN_TAGS,
 )
 
 
-@sensor(
-    job=src_chesscom_games_job,
-    minimum_interval_seconds=60*5, 
-    default_status=DefaultSensorStatus.RUNNING
-)
-def chesscom_new_games_sensor(context):
-    POSTGRES_URL = os.getenv("POSTGRES_URL")
-    if not POSTGRES_URL:
-        yield SkipReason("Missing env var POSTGRES_URL")
-        return
+def _evaluate_new_games(context, profiler):
+    started = time.monotonic()
 
-    players = [p for p in _load_players_from_yaml()]
+    players = [p for p in _load_players_from_yaml() if getattr(p, "username", None)]
     if not players:
         yield SkipReason("No players configured.")
         return
 
-    engine = create_engine(POSTGRES_URL)
+    state = _load_cursor(context.cursor)
+    now = utc_now().timestamp()
+    usernames = [p.username for p in players]
 
-    last_end_by_user: dict[str, datetime | None] = {}
-    for p in players:
-        username = getattr(p, "username", None)
-        if not username:
-            continue
-        last_end_by_user[username] = _latest_end_time_utc(engine, username)
+    reconcile = (
+        state["reconciled_at"] is None
+        or now - state["reconciled_at"] >= RECONCILE_INTERVAL_SECONDS
+        or any(username not in state["watermarks"] for username in usernames)
+    )
+    # the run storage is only read while requested runs are outstanding
+    if state["requested"] and _settle_requested(context.instance, state):
+        context.log.info("Requested chess.com ingest runs finished, reconciling watermarks.")
+        reconcile = True
+
+    if reconcile:
+        POSTGRES_URL = os.getenv("POSTGRES_URL")
+        if not POSTGRES_URL:
+            yield SkipReason("Missing env var POSTGRES_URL")
+            return
+
+        db_watermarks = _latest_end_times(create_engine(POSTGRES_URL), usernames)
+        if db_watermarks is None:
+            yield SkipReason("src_chesscom.game_members does not exist, run src_chesscom_swap first.")
+            return
+
+        # runs still in flight keep the watermark the sensor advanced to
+        previous = state["watermarks"]
+        state["watermarks"] = {
+            username: (
+                max(filter(None, (end, state["watermarks"].get(username))), default=None)
+                if username in state["requested"]
+                else end
+            )
+            for username, end in db_watermarks.items()
+        }
+        # a watermark moving back means games the sensor saw were not ingested,
+        # their archive months must be fetched in full on the next probe
+        for username, end in state["watermarks"].items():
+            if previous.get(username) is not None and (end or 0) < previous[username]:
+                state["etags"].pop(username, None)
+        # requests that never turned into a run (e.g. a duplicate run_key) expire here
+        state["requested"] = {
+            username: requested_at
+            for username, requested_at in state["requested"].items()
+            if now - requested_at < RECONCILE_INTERVAL_SECONDS
+        }
+        state["reconciled_at"] = now
 
-    async def detect_new_games() -> dict[str, dict]:
-        async with aiohttp.ClientSession() as session:
-            api = ChesscomAPI(session)
-            results: dict[str, dict] = {}
+    months = sorted({_archive_month(state["ticked_at"] or now), _archive_month(now)})
+    current_month = _archive_month(now)
 
-            for p in players:
-                username = getattr(p, "username", None)
-                if not username:
+    async def detect_new_games() -> tuple[dict[str, int | None], int]:
+        user_agent = os.getenv("CHESS_GURU_USER_AGENT", DEFAULT_USER_AGENT)
+        results: dict[str, int | None] = {}
+        not_modified = 0
+
+        async with aiohttp.ClientSession(headers={"User-Agent": user_agent}) as session:
+            for username in usernames:
+                if username in state["requested"]:
                     continue
 
-                last_end = last_end_by_user.get(username)
-                from_ts = last_end + timedelta(seconds=1) if last_end else None
+                last_end = state["watermarks"].get(username)
+                if last_end is None:
+                    if username not in state["backfills"]:
+                        # nothing ingested yet, the run backfills the full history
+                        results[username] = None
+                        continue
+                    # backfilled without any games, the first ones show up in a probe
+                    last_end = 0
+
+                etags = state["etags"].get(username, {})
+                new_etags: dict[str, str] = {}
+                max_end = None
 
                 try:
-                    payload = await api.get_games(
-                        username=username,
-                        from_ts=from_ts,
-                        to_ts=utc_now(),
-                    )
+                    for month in months:
+                        games, etag = await _probe_archive_month(
+                            session, username, month, etags.get(month)
+                        )
+                        if etag and month == current_month:
+                            new_etags[month] = etag
+                        if games is None:
+                            not_modified += 1
+                            continue
+
+                        for g in games:
+                            end_time = g.get("end_time")
+                            if isinstance(end_time, (int, float)) and end_time > last_end:
+                                max_end = max(max_end or 0, int(end_time))
                 except Exception as exc:
                     context.log.warning(
-                        "chesscom get_games failed for username=%s: %s",
+                        "chesscom archive probe failed for username=%s: %s",
                         username,
                         exc,
                     )
                     continue
 
-                games = _extract_games(payload)
-                if not games:
-                    continue
+                state["etags"][username] = new_etags
+                if max_end is not None:
+                    results[username] = max_end
 
-                max_end = None
-                for g in games:
-                    end_time = g.get("end_time")
-                    if isinstance(end_time, (int, float)):
-                        g_dt = datetime.fromtimestamp(end_time, tz=timezone.utc)
-                        if max_end is None or g_dt > max_end:
-                            max_end = g_dt
+        return results, not_modified
+
+    results, not_modified = run_async(detect_new_games(), profiler)
+
+    run_requests = []
+    for username, max_end in results.items():
+        if max_end is None:
+            run_key = f"chesscom_games:{username}:backfill"
+            state["backfills"][username] = now
+        else:
+            max_end_dt = datetime.fromtimestamp(max_end, tz=timezone.utc)
+            run_key = f"chesscom_games:{username}:{max_end_dt.isoformat()}"
+            state["watermarks"][username] = max_end
+        # the same window is requested again after a failed run, under a new key
+        attempt = state["attempts"].get(username, 0)
+        if attempt:
+            run_key = f"{run_key}:attempt-{attempt}"
 
-                results[username] = {
-                    "new_count": len(games),
-                    "max_end": max_end,
-                }
+        state["requested"][username] = now
+        context.log.info("New games detected for %s (max_end=%s).", username, max_end)
+        run_requests.append(
+            RunRequest(
+                run_key=run_key,
+                run_config={
+                    "ops": {
+                        "src_chesscom__games": {
+                            "config": {"usernames": [username]},
+                        }
+                    }
+                },
+                tags={"username": username},
+            )
+        )
 
-            return results
+    state["ticked_at"] = now
+    context.update_cursor(json.dumps(state, separators=(",", ":")))
 
-    results = asyncio.run(detect_new_games())
+    tick_seconds = time.monotonic() - started
+    context.log.info(
+        "chesscom sensor tick_seconds=%.3f reconciled=%s probes_not_modified=%s runs_requested=%s",
+        tick_seconds,
+        reconcile,
+        not_modified,
+        len(run_requests),
+    )
 
-    if not results:
-        yield SkipReason("No new chess.com games detected.")
+    if not run_requests:
+        yield SkipReason(f"No new chess.com games detected ({tick_seconds:.2f}s).")
         return
 
-    for username, info in results.items():
-        max_end = info.get("max_end")
-        run_key = f"chesscom_games:{username}:{max_end.isoformat() if max_end else 'unknown'}"
-        context.log.info("New games detected for %s (count=%s).", username, info["new_count"])
-        yield RunRequest(
-            run_key=run_key,
-            run_config={
-                "ops": {
-                    "src_chesscom__games": {
-                        "config": {"usernames": [username]},
-                    }
-                }
-            },
-            tags={"username": username},
-        )
+    yield from run_requests
+
+
+@sensor(
+    job=src_chesscom_games_job,
+    minimum_interval_seconds=60*5,
+    default_status=DefaultSensorStatus.RUNNING
+)
+def chesscom_new_games_sensor(context):
+    """
+    Requests an ingest run per player with new chess.com games.
+
+    Watermarks live in the sensor cursor and are advanced when a run is requested,
+    so a regular tick only sends conditional GETs for the player's current archive
+    month (mostly 304s) and runs no SQL. The cursor is reconciled against
+    src_chesscom.game_members hourly, for new players, and after a requested run fails.
+    CHESS_DAGSTER_PROFILE=chesscom_new_games_sensor samples each tick into the tick log.
+    """
+    with profiled(context, "chesscom_new_games_sensor") as profiler:
+        evaluation = list(_evaluate_new_games(context, profiler))
+    yield from evaluation
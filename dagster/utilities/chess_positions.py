@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import random
+
+# chess.com's TCN move encoding: two characters per move, square index = file + 8 * rank
+TCN_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!?{~}(^)[_]@#$,./&-*++="
+TCN_PROMOTIONS = "qnrbkp"
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+PIECES = "PNBRQKpnbrqk"
+CASTLING_RIGHTS = "KQkq"
+
+# fixed seed so hashes are stable across processes and runs
+_rng = random.Random(0x5EED_C4E55)
+PIECE_KEYS = {piece: [_rng.getrandbits(64) for _ in range(64)] for piece in PIECES}
+CASTLING_KEYS = {right: _rng.getrandbits(64) for right in CASTLING_RIGHTS}
+EP_FILE_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+WHITE_TO_MOVE_KEY = _rng.getrandbits(64)
+
+# rook home square -> castling right lost when it moves or is captured
+_ROOK_CORNERS = {0: "Q", 7: "K", 56: "q", 63: "k"}
+
+
+def decode_tcn(tcn: str) -> list[tuple[int, int, str | None]]:
+    """Decodes a TCN string into (from_square, to_square, promotion) per ply."""
+    moves: list[tuple[int, int, str | None]] = []
+    for i in range(0, len(tcn) - 1, 2):
+        from_sq = TCN_ALPHABET.index(tcn[i])
+        to_sq = TCN_ALPHABET.index(tcn[i + 1])
+        promotion = None
+
+        if from_sq > 75:
+            raise ValueError("piece drops are not supported")
+
+        if to_sq > 63:
+            promotion = TCN_PROMOTIONS[(to_sq - 64) // 3]
+            # the remainder encodes the file offset: capture left, push, capture right
+            to_sq = from_sq + (-8 if from_sq < 16 else 8) + (to_sq - 1) % 3 - 1
+
+        moves.append((from_sq, to_sq, promotion))
+
+    return moves
+
+
+def to_signed_64(value: int) -> int:
+    """Postgres bigint is signed."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class Position:
+    """Minimal board that replays from/to moves and keeps a Zobrist hash up to date."""
+
+    def __init__(self, fen: str = START_FEN):
+        fields = fen.split()
+        placement = fields[0]
+        self.board: list[str | None] = [None] * 64
+        self.piece_hash = 0
+
+        for rank_idx, rank in enumerate(placement.split("/")):
+            file_idx = 0
+            for char in rank:
+                if char.isdigit():
+                    file_idx += int(char)
+                    continue
+                self._put((7 - rank_idx) * 8 + file_idx, char)
+                file_idx += 1
+
+        self.white_to_move = len(fields) < 2 or fields[1] == "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        self.castling = {c for c in castling if c in CASTLING_RIGHTS}
+        ep = fields[3] if len(fields) > 3 else "-"
+        self.ep_square = None if ep == "-" else (ord(ep[0]) - 97) + 8 * (int(ep[1]) - 1)
+
+    def _put(self, square: int, piece: str | None) -> None:
+        old = self.board[square]
+        if old:
+            self.piece_hash ^= PIECE_KEYS[old][square]
+        self.board[square] = piece
+        if piece:
+            self.piece_hash ^= PIECE_KEYS[piece][square]
+
+    def _ep_capturable(self) -> bool:
+        # only hash the en passant file when a pawn can actually take,
+        # so transpositions hash to the same key
+        if self.ep_square is None:
+            return False
+        pawn = "P" if self.white_to_move else "p"
+        behind = self.ep_square - 8 if self.white_to_move else self.ep_square + 8
+        file_idx = behind % 8
+        return any(
+            0 <= file_idx + d < 8 and self.board[behind + d] == pawn for d in (-1, 1)
+        )
+
+    def zobrist(self) -> int:
+        h = self.piece_hash
+        for right in self.castling:
+            h ^= CASTLING_KEYS[right]
+        if self._ep_capturable():
+            h ^= EP_FILE_KEYS[self.ep_square % 8]
+        if self.white_to_move:
+            h ^= WHITE_TO_MOVE_KEY
+        return h
+
+    def push(self, from_sq: int, to_sq: int, promotion: str | None = None) -> None:
+        piece = self.board[from_sq]
+        if piece is None:
+            raise ValueError(f"no piece on square {from_sq}")
+
+        white = piece.isupper()
+        kind = piece.upper()
+        target = self.board[to_sq]
+        ep_square = self.ep_square
+        self.ep_square = None
+
+        if kind == "K":
+            self.castling -= {"K", "Q"} if white else {"k", "q"}
+            own_rook = "R" if white else "r"
+            file_delta = to_sq % 8 - from_sq % 8
+            if abs(file_delta) == 2 or target == own_rook:
+                # castling, encoded either as king two files over or king onto rook
+                kingside = file_delta > 0
+                rank_base = from_sq - from_sq % 8
+                rook_from = to_sq if target == own_rook else rank_base + (7 if kingside else 0)
+                self._put(from_sq, None)
+                self._put(rook_from, None)
+                self._put(rank_base + (6 if kingside else 2), piece)
+                self._put(rank_base + (5 if kingside else 3), own_rook)
+                self.white_to_move = not self.white_to_move
+                return
+
+        for square in (from_sq, to_sq):
+            if square in _ROOK_CORNERS:
+                self.castling.discard(_ROOK_CORNERS[square])
+
+        if kind == "P":
+            if to_sq == ep_square and target is None and from_sq % 8 != to_sq % 8:
+                self._put(to_sq - 8 if white else to_sq + 8, None)
+            if abs(to_sq - from_sq) == 16:
+                self.ep_square = (from_sq + to_sq) // 2
+            if promotion:
+                piece = promotion.upper() if white else promotion.lower()
+
+        self._put(from_sq, None)
+        self._put(to_sq, piece)
+        self.white_to_move = not self.white_to_move
+
+
+def position_hashes(tcn: str, initial_fen: str | None = None) -> list[int]:
+    """Signed 64-bit Zobrist hashes of every position in a game, index = ply."""
+    position = Position(initial_fen or START_FEN)
+    hashes = [to_signed_64(position.zobrist())]
+    for from_sq, to_sq, promotion in decode_tcn(tcn):
+        position.push(from_sq, to_sq, promotion)
+        hashes.append(to_signed_64(position.zobrist()))
+    return hashes
+
+
+def fen_position_hash(fen: str) -> int:
+    """Hash to look up in src_chesscom.game_positions for a given FEN."""
+    return to_signed_64(Position(fen).zobrist())
+
+
+def parse_clock_deciseconds(clock: str | None) -> int | None:
+    """'0:09:58.7' -> 5987"""
+    if not clock:
+        return None
+    try:
+        parts = [float(p) for p in clock.split(":")]
+    except ValueError:
+        return None
+
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return round(seconds * 10)
+
+
+def packed_moves(game: dict) -> dict[str, list | None]:
+    """
+    Per-ply arrays for a chess.com game: SAN and clock (deciseconds) from
+    parsed_pgn, from/to squares and promotion piece (index + 1 into "qnrb") from tcn.
+    """
+    rounds = ((game.get("parsed_pgn") or {}).get("moves")) or {}
+    move_san: list[str | None] = []
+    clock_ds: list[int | None] = []
+
+    for key in sorted(rounds, key=lambda k: int(k) if str(k).isdigit() else 0):
+        for color in ("white", "black"):
+            ply = (rounds[key] or {}).get(color)
+            # odd plies are always white, only a final black ply may be missing
+            if not ply and color == "black":
+                continue
+            ply = ply or {}
+            move_san.append(ply.get("move"))
+            clock_ds.append(parse_clock_deciseconds(ply.get("clock")))
+
+    packed: dict[str, list | None] = {
+        "move_san": move_san or None,
+        "clock_ds": clock_ds or None,
+        "move_from": None,
+        "move_to": None,
+        "move_promo": None,
+    }
+
+    tcn = game.get("tcn")
+    if tcn:
+        try:
+            moves = decode_tcn(tcn)
+        except (ValueError, IndexError):
+            return packed
+        packed["move_from"] = [m[0] for m in moves]
+        packed["move_to"] = [m[1] for m in moves]
+        packed["move_promo"] = [TCN_PROMOTIONS.index(m[2]) + 1 if m[2] else 0 for m in moves]
+
+    return packed
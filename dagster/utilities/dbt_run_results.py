@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime
+
+from sqlalchemy import text
+
+# runtime ~ input_rows ** exponent, linear models sit around 1.0
+SCALING_EXPONENT_THRESHOLD = 1.25
+SCALING_MIN_RUNS = 5
+HISTORY_RUNS = 20
+
+
+def model_timings(run_results: dict, manifest: dict) -> dict[str, dict]:
+    """
+    Per-model timing from a dbt run_results.json, keyed by unique_id.
+    Parents come from the manifest so runtime can be related to input size.
+    """
+    nodes = manifest.get("nodes", {}) or {}
+    sources = manifest.get("sources", {}) or {}
+    timings: dict[str, dict] = {}
+
+    for result in run_results.get("results", []) or []:
+        unique_id = result.get("unique_id", "")
+        node = nodes.get(unique_id) or {}
+        if node.get("resource_type") != "model":
+            continue
+
+        adapter_response = result.get("adapter_response") or {}
+        parents = [
+            (nodes.get(parent_id) or sources.get(parent_id) or {}).get("relation_name")
+            for parent_id in (node.get("depends_on") or {}).get("nodes", [])
+        ]
+        timings[unique_id] = {
+            "relation_name": node.get("relation_name"),
+            "status": result.get("status"),
+            "execution_time": result.get("execution_time") or 0.0,
+            "rows_affected": adapter_response.get("rows_affected"),
+            "parent_relations": [p for p in parents if p],
+            "compiled_code": result.get("compiled_code"),
+        }
+
+    return timings
+
+
+def _relation_stats(conn, relations: list[str]) -> dict[str, tuple[int | None, int | None]]:
+    """relation -> (planner row estimate, None if never analyzed, bytes on disk)."""
+    sql = text("""
+        select
+            relation,
+            case when c.reltuples >= 0 then c.reltuples::bigint end as row_estimate,
+            pg_total_relation_size(c.oid) as relation_bytes
+        from unnest(cast(:relations as text[])) as relation
+        left join pg_class as c on c.oid = to_regclass(relation)
+    """)
+    return {
+        relation: (row_estimate, relation_bytes)
+        for relation, row_estimate, relation_bytes in conn.execute(sql, {"relations": relations})
+    }
+
+
+def add_relation_stats(conn, timings: dict[str, dict]) -> None:
+    """
+    Adds input_rows and the built relation's on-disk size to each timing, from
+    the catalog only. Parents built in this run count with the rows dbt reports
+    for them, other parents with their planner estimate. A parent without either
+    (reltuples = -1, never analyzed) makes input_rows None, i.e. unknown, rather
+    than reading as 0 rows.
+    """
+    relations = sorted(
+        {r for t in timings.values() for r in t["parent_relations"]}
+        | {t["relation_name"] for t in timings.values() if t["relation_name"]}
+    )
+    if not relations:
+        return
+
+    built_rows = {
+        t["relation_name"]: t["rows_affected"]
+        for t in timings.values()
+        if t["relation_name"] and t["status"] == "success" and t["rows_affected"] is not None
+    }
+    stats = _relation_stats(conn, relations)
+
+    def rows(relation: str) -> int | None:
+        if relation in built_rows:
+            return int(built_rows[relation])
+        return stats.get(relation, (None, None))[0]
+
+    for timing in timings.values():
+        parent_rows = [rows(r) for r in timing["parent_relations"]]
+        timing["input_rows"] = None if None in parent_rows else sum(parent_rows)
+        timing["relation_bytes"] = stats.get(timing["relation_name"], (None, None))[1]
+
+
+# idempotent, dbt timings accumulate across deployments and are never recreated
+_CREATE_RUN_HISTORY = [
+    "create schema if not exists dbt_ops",
+    """
+    create table if not exists dbt_ops.run_history (
+        invocation_id text not null,
+        unique_id text not null,
+        relation_name text,
+        status text,
+        execution_time double precision not null,
+        rows_affected bigint,
+        input_rows bigint,
+        relation_bytes bigint,
+        completed_at_utc timestamptz not null,
+        primary key (invocation_id, unique_id)
+    )
+    """,
+    """
+    create index if not exists run_history_unique_id_completed_at_utc_idx
+    on dbt_ops.run_history (unique_id, completed_at_utc desc)
+    """,
+]
+
+
+def record_run_history(
+    conn, invocation_id: str, completed_at: datetime, timings: dict[str, dict]
+) -> None:
+    """Appends this run's timings, creating dbt_ops.run_history on first use."""
+    for stmt in _CREATE_RUN_HISTORY:
+        conn.execute(text(stmt))
+
+    sql = text("""
+        insert into dbt_ops.run_history (
+            invocation_id,
+            unique_id,
+            relation_name,
+            status,
+            execution_time,
+            rows_affected,
+            input_rows,
+            relation_bytes,
+            completed_at_utc
+        )
+        values (
+            :invocation_id,
+            :unique_id,
+            :relation_name,
+            :status,
+            :execution_time,
+            :rows_affected,
+            :input_rows,
+            :relation_bytes,
+            :completed_at_utc
+        )
+        on conflict (invocation_id, unique_id) do nothing
+    """)
+
+    rows = [
+        {
+            "invocation_id": invocation_id,
+            "unique_id": unique_id,
+            "relation_name": t["relation_name"],
+            "status": t["status"],
+            "execution_time": t["execution_time"],
+            "rows_affected": t["rows_affected"],
+            "input_rows": t.get("input_rows"),
+            "relation_bytes": t.get("relation_bytes"),
+            "completed_at_utc": completed_at,
+        }
+        for unique_id, t in timings.items()
+    ]
+    if rows:
+        conn.execute(sql, rows)
+
+
+def scaling_exponent(
+    points: list[tuple[float, float]], min_points: int = SCALING_MIN_RUNS
+) -> float | None:
+    """
+    Least squares slope of log(runtime) over log(input size).
+    None when there are too few points or input size never changed.
+    """
+    points = [(rows, seconds) for rows, seconds in points if rows and rows > 0 and seconds > 0]
+    if len(points) < min_points:
+        return None
+
+    xs = [math.log(rows) for rows, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    x_var = sum((x - x_mean) ** 2 for x in xs)
+    # less than ~10% spread in input size says nothing about scaling
+    if x_var < len(xs) * 0.01:
+        return None
+
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / x_var
+
+
+def scaling_exponents(conn, unique_ids: list[str]) -> dict[str, float | None]:
+    """Scaling exponent per model over its last HISTORY_RUNS successful runs."""
+    sql = text("""
+        select unique_id, input_rows, execution_time
+        from (
+            select
+                unique_id,
+                input_rows,
+                execution_time,
+                row_number() over (partition by unique_id order by completed_at_utc desc) as run_rank
+            from dbt_ops.run_history
+            where unique_id = any(:unique_ids)
+              and status = 'success'
+        ) as recent
+        where run_rank <= :history_runs
+    """)
+
+    points: dict[str, list[tuple[float, float]]] = {u: [] for u in unique_ids}
+    for unique_id, input_rows, execution_time in conn.execute(
+        sql, {"unique_ids": unique_ids, "history_runs": HISTORY_RUNS}
+    ):
+        points[unique_id].append((input_rows, execution_time))
+
+    return {unique_id: scaling_exponent(p) for unique_id, p in points.items()}
+
+
+def explain_analyze(engine, compiled_code: str) -> str:
+    """
+    EXPLAIN (ANALYZE) of a model's compiled select. ANALYZE executes the query,
+    so it runs in a transaction that is always rolled back.
+    """
+    sql = "explain (analyze, buffers, format text) " + compiled_code.strip().rstrip(";")
+
+    # straight to the driver, compiled sql is not a bind-parameter template
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.execute(sql)
+            return "\n".join(row[0] for row in cur.fetchall())
+    finally:
+        raw_conn.rollback()
+        raw_conn.close()
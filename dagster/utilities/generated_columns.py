@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from pathlib import Path
+
+from sqlalchemy import text
+
+from utilities.utils import load_yaml
+
+DBT_MODELS_DIR = Path(__file__).resolve().parents[2] / "dbt" / "models"
+GENERATED_PREFIX = "gc_"
+# whole documents and arrays gain nothing from being copied out of the payload
+SKIPPED_TYPES = {"jsonb", "json"}
+# columns hold the extracted text, dbt casts it, so a payload the cast rejects
+# fails the model build instead of the ingest insert
+STORED_TYPE = "text"
+# a cast inside the expression could still fail on insert, those stay in dbt
+_CAST = re.compile(r"::|\bcast\s*\(", re.IGNORECASE)
+
+
+def generated_column_name(cast_type: str, expr: str, alias: str) -> str:
+    """
+    Must match the type_mapper macro: the hash changes with the mapping, so an
+    edited expression gets a new column instead of silently reading the old one.
+    """
+    key = f"{STORED_TYPE}:{cast_type.strip()}:{expr.strip()}"
+    digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+    return f"{GENERATED_PREFIX}{alias.strip()}_{digest[:8]}"
+
+
+def desired_columns(models_dir: Path = DBT_MODELS_DIR) -> dict[str, dict[str, tuple[str, str]]]:
+    """
+    {table: {column: (type, expression)}} for every model whose meta names a
+    `generated_columns_from` table, one column per cast-free payload path in its
+    column_mapping.
+    """
+    tables: dict[str, dict[str, tuple[str, str]]] = {}
+    for path in sorted(models_dir.rglob("*.yml")):
+        for model in load_yaml(path).get("models", []) or []:
+            meta = (model.get("config") or {}).get("meta") or model.get("meta") or {}
+            table = meta.get("generated_columns_from")
+            if not table:
+                continue
+
+            columns = tables.setdefault(table, {})
+            for cast_type, mappings in (meta.get("column_mapping") or {}).items():
+                cast_type = str(cast_type).strip()
+                if cast_type in SKIPPED_TYPES or cast_type.endswith("[]"):
+                    continue
+                for expr, alias in mappings.items():
+                    expr = str(expr).strip()
+                    if "payload" not in expr or _CAST.search(expr):
+                        continue
+                    columns[generated_column_name(cast_type, expr, alias)] = (cast_type, expr)
+
+    return tables
+
+
+def _add_column_sql(table: str | None, column: str, expr: str) -> str:
+    clause = f"add column {column} {STORED_TYPE} generated always as (({expr})::{STORED_TYPE}) stored"
+    return f"alter table {table} {clause}" if table else clause
+
+
+def provision(conn, table: str, columns: dict[str, tuple[str, str]]) -> dict[str, list]:
+    """
+    Adds the missing stored generated columns and drops gc_ columns no mapping
+    uses anymore, including typed ones from before the columns were text only.
+    Expressions Postgres rejects (not immutable) are skipped and keep being
+    extracted by dbt.
+    """
+    schema, name = table.split(".")
+    existing = {
+        row[0]
+        for row in conn.execute(
+            text("""
+                select column_name
+                from information_schema.columns
+                where table_schema = :schema
+                    and table_name = :name
+                    and column_name like 'gc\\_%'
+            """),
+            {"schema": schema, "name": name},
+        )
+    }
+
+    # probe each expression on an empty copy, the real table is rewritten once
+    probe = f"gc_probe_{name}"
+    conn.execute(text(f"create temp table {probe} (like {table}) on commit drop"))
+    added, skipped = [], []
+    for column, (_, expr) in columns.items():
+        if column in existing:
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(text(_add_column_sql(probe, column, expr)))
+            added.append(column)
+        except Exception as exc:
+            skipped.append({"column": column, "expression": expr, "error": str(exc).splitlines()[0]})
+
+    if added:
+        clauses = ",\n".join(
+            _add_column_sql(None, column, columns[column][1]) for column in added
+        )
+        conn.execute(text(f"alter table {table}\n{clauses}"))
+
+    dropped = sorted(existing - set(columns))
+    for column in dropped:
+        conn.execute(text(f"alter table {table} drop column {column}"))
+
+    return {"added": added, "dropped": dropped, "skipped": skipped}
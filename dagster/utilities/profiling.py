@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from dagster import MetadataValue
+
+# run tag or CHESS_DAGSTER_PROFILE (1 / all / comma separated asset and sensor names)
+PROFILE_TAG = "chess_dagster/profile"
+PROFILE_ENV = "CHESS_DAGSTER_PROFILE"
+PROFILE_DIR_ENV = "CHESS_DAGSTER_PROFILE_DIR"
+PROFILE_INTERVAL_ENV = "CHESS_DAGSTER_PROFILE_INTERVAL_MS"
+DEFAULT_INTERVAL_MS = 10
+MAX_STACK_DEPTH = 128
+TOP_N = 25
+
+
+def profiling_requested(context, name: str) -> bool:
+    requested = os.getenv(PROFILE_ENV, "").strip().lower()
+    if requested in {"1", "true", "all"} or name.lower() in requested.split(","):
+        return True
+
+    # sensor contexts have no run
+    run = getattr(context, "run", None)
+    tags = getattr(run, "tags", None) or {}
+    return str(tags.get(PROFILE_TAG, "")).lower() in {"1", "true"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = Path(code.co_filename).stem
+    return f"{code.co_qualname} ({module})".replace(";", ":")
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack from a background thread into collapsed
+    stacks (flamegraph.pl / speedscope input). An event loop idling in select
+    shows up as waiting on the network. `task_factory` adds wall time per
+    coroutine for loops started through `run_async`.
+    """
+
+    def __init__(self, name: str, interval_seconds: float | None = None):
+        self.name = name
+        self.interval_seconds = interval_seconds or (
+            float(os.getenv(PROFILE_INTERVAL_ENV, DEFAULT_INTERVAL_MS)) / 1000
+        )
+        self.thread_id = threading.get_ident()
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.wall_seconds = 0.0
+        self.path: Path | None = None
+        # coroutine qualname -> [tasks, total wall seconds, max wall seconds]
+        self.coroutines: dict[str, list] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.wall_seconds = time.perf_counter() - self._started
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+                self.samples += 1
+            del frame
+
+    def record_coroutine(self, name: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        stats = self.coroutines.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def task_factory(self, loop, coro, **kwargs):
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        name = getattr(coro, "__qualname__", type(coro).__name__)
+        started = time.perf_counter()
+        task.add_done_callback(lambda _: self.record_coroutine(name, started))
+        return task
+
+    def write_collapsed(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        self.path = path
+        return path
+
+    def hot_functions(self, top_n: int = TOP_N) -> list[tuple[str, int, int]]:
+        """(function, self samples, total samples) by self samples."""
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [(label, count, total[label]) for label, count in own.most_common(top_n)]
+
+    def hot_functions_markdown(self, top_n: int = TOP_N) -> str:
+        samples = max(self.samples, 1)
+        lines = ["| function | self % | total % |", "| --- | ---: | ---: |"]
+        for label, own, total in self.hot_functions(top_n):
+            lines.append(f"| `{label}` | {100 * own / samples:.1f} | {100 * total / samples:.1f} |")
+        return "\n".join(lines)
+
+    def coroutines_markdown(self, top_n: int = TOP_N) -> str:
+        lines = ["| coroutine | tasks | total s | max s |", "| --- | ---: | ---: | ---: |"]
+        ranked = sorted(self.coroutines.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (tasks, total, longest) in ranked[:top_n]:
+            lines.append(f"| `{name}` | {tasks} | {total:.3f} | {longest:.3f} |")
+        return "\n".join(lines)
+
+    def metadata(self) -> dict:
+        metadata = {
+            "profile_samples": self.samples,
+            "profile_wall_seconds": round(self.wall_seconds, 3),
+            "profile_hot_functions": MetadataValue.md(self.hot_functions_markdown()),
+        }
+        if self.path is not None:
+            metadata["profile_collapsed_stacks"] = MetadataValue.path(str(self.path))
+        if self.coroutines:
+            metadata["profile_coroutines"] = MetadataValue.md(self.coroutines_markdown())
+        return metadata
+
+
+def _profile_path(context, name: str) -> Path:
+    base = os.getenv(PROFILE_DIR_ENV)
+    if not base:
+        dagster_home = os.getenv("DAGSTER_HOME")
+        base = (
+            Path(dagster_home) / "profiles"
+            if dagster_home
+            else Path(tempfile.gettempdir()) / "chess_dagster_profiles"
+        )
+    run_id = getattr(context, "run_id", None) or time.strftime("%Y%m%dT%H%M%S")
+    return Path(base) / f"{name}_{run_id}.collapsed"
+
+
+@contextmanager
+def profiled(context, name: str, enabled: bool = False):
+    """
+    Yields a running SamplingProfiler when enabled or requested by run tag/env,
+    otherwise None. On exit the collapsed stacks are written and the hot
+    functions logged, attach `profiler.metadata()` where outputs allow it.
+    """
+    if not (enabled or profiling_requested(context, name)):
+        yield None
+        return
+
+    profiler = SamplingProfiler(name)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        path = profiler.write_collapsed(_profile_path(context, name))
+        context.log.info(
+            "%s profile: %s samples over %.3fs written to %s\n%s",
+            name,
+            profiler.samples,
+            profiler.wall_seconds,
+            path,
+            profiler.hot_functions_markdown(top_n=10),
+        )
+
+
+def run_async(main, profiler: SamplingProfiler | None = None):
+    """asyncio.run, with per-coroutine wall time recorded when profiling."""
+    if profiler is None:
+        return asyncio.run(main)
+
+    async def instrumented():
+        asyncio.get_running_loop().set_task_factory(profiler.task_factory)
+        started = time.perf_counter()
+        try:
+            return await main
+        finally:
+            profiler.record_coroutine(getattr(main, "__qualname__", "main"), started)
+
+    return asyncio.run(instrumented())
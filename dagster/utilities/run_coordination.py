@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from dagster import (
+    AssetKey,
+    DagsterRunStatus,
+    DefaultScheduleStatus,
+    RunRequest,
+    RunsFilter,
+    SkipReason,
+    schedule,
+)
+
+# op-level concurrency pools, limits come from the instance (see .dagster/dagster.yaml)
+CHESSCOM_API_POOL = "chesscom_api"
+LICHESS_API_POOL = "lichess_api"
+POSTGRES_WRITER_POOL = "postgres_writer"
+POOLS = [CHESSCOM_API_POOL, LICHESS_API_POOL, POSTGRES_WRITER_POOL]
+
+# run-level tags matched by tag_concurrency_limits in .dagster/dagster.yaml
+CHESSCOM_API_TAG = "chess_dagster/chesscom_api"
+LICHESS_API_TAG = "chess_dagster/lichess_api"
+POSTGRES_WRITER_TAG = "chess_dagster/postgres_writer"
+
+CHESSCOM_INGEST_RUN_TAGS = {CHESSCOM_API_TAG: "true", POSTGRES_WRITER_TAG: "true"}
+LICHESS_INGEST_RUN_TAGS = {LICHESS_API_TAG: "true", POSTGRES_WRITER_TAG: "true"}
+POSTGRES_WRITER_RUN_TAGS = {POSTGRES_WRITER_TAG: "true"}
+
+IN_PROGRESS_STATUSES = [
+    DagsterRunStatus.QUEUED,
+    DagsterRunStatus.NOT_STARTED,
+    DagsterRunStatus.STARTING,
+    DagsterRunStatus.STARTED,
+]
+
+
+def runs_in_progress(instance, job_name: str, asset_keys: list[AssetKey]) -> list:
+    """Unfinished runs of the job, or of any other job touching the same assets."""
+    keys = set(asset_keys)
+    return [
+        record.dagster_run
+        for record in instance.get_run_records(filters=RunsFilter(statuses=IN_PROGRESS_STATUSES))
+        if record.dagster_run.job_name == job_name
+        or keys & set(record.dagster_run.asset_selection or ())
+    ]
+
+
+def queue_depth(instance) -> dict[str, int]:
+    """Runs per unfinished status plus claimed/pending slots per concurrency pool."""
+    depth = {
+        status.value.lower(): instance.get_runs_count(filters=RunsFilter(statuses=[status]))
+        for status in IN_PROGRESS_STATUSES
+    }
+
+    storage = instance.event_log_storage
+    if storage.supports_global_concurrency_limits:
+        for pool in POOLS:
+            info = storage.get_concurrency_info(pool)
+            depth[f"{pool}_claimed"] = len(info.claimed_slots)
+            depth[f"{pool}_pending"] = len(info.pending_steps)
+
+    return depth
+
+
+def non_overlapping_schedule(name: str, job, cron_schedule: str, asset_keys: list[AssetKey]):
+    """
+    Cron schedule that skips a tick while an earlier run for the same assets is
+    queued or running, so a slow API does not pile up runs behind each other.
+    """
+
+    @schedule(
+        name=name,
+        job=job,
+        cron_schedule=cron_schedule,
+        default_status=DefaultScheduleStatus.RUNNING,
+    )
+    def _schedule(context):
+        running = runs_in_progress(context.instance, job.name, asset_keys)
+        if not running:
+            return RunRequest()
+
+        depth = queue_depth(context.instance)
+        context.log.info("skipping %s, %s run(s) in progress, queue=%s", name, len(running), depth)
+        return SkipReason(
+            f"{len(running)} run(s) for {name} still in progress ({running[0].run_id}), "
+            f"queued={depth['queued']} started={depth['started']}"
+        )
+
+    return _schedule
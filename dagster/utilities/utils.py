@@ -6,6 +6,7 @@ from pathlib import Path
 from typing import Optional
 
 import yaml
+from sqlalchemy.engine import make_url
 
 ALLOWED_PLATFORMS = {"chesscom", "lichess"}
 
@@ -65,10 +66,20 @@ def load_chess_players(yml_path: str | Path) -> list[ChessPlayer]:
     return players
 
 
-def load_players_from_yaml() -> list[ChessPlayer]:
+def load_players_from_yaml(online_platform: str | None = None) -> list[ChessPlayer]:
     yml_path = Path(__file__).resolve().parents[1] / "assets" / "asset_definitions" / "chess_players.yml"
-    return load_chess_players(yml_path)
+    players = load_chess_players(yml_path)
+    if online_platform is None:
+        return players
+    return [p for p in players if p.online_platform == online_platform]
 
 
 def utc_now() -> datetime:
     return datetime.now(timezone.utc)
+
+
+def libpq_url(sqlalchemy_url: str) -> str:
+    """postgresql+psycopg2://... -> postgresql://... for non-SQLAlchemy clients."""
+    return make_url(sqlalchemy_url).set(drivername="postgresql").render_as_string(
+        hide_password=False
+    )
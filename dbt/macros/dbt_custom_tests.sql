@@ -1,9 +1,62 @@
-{% test ratio_condition(model, condition, column_name=None, max_ratio=0.01, where=None) %}
+{% test ratio_condition(
+    model,
+    condition,
+    column_name=None,
+    max_ratio=0.01,
+    where=None,
+    incremental_column=None,
+    state_key=None,
+    sample_percent=None,
+    sample_method="system"
+) %}
+    {#-
+        Fails when more than max_ratio of the checked rows match condition.
+
+        incremental_column + state_key: only rows with incremental_column past the
+        watermark of the last passing run are checked. The upper bound is captured
+        when the test starts and committed by ratio_condition_commit (on-run-end)
+        if the test passes, so the column should be indexed and only ever grow.
+        `--vars '{ratio_condition_full_scan: true}'` checks everything again.
+
+        sample_percent: checks a TABLESAMPLE of the rows instead, an estimate of
+        the same ratio for tables too big to scan on every build.
+    -#}
+    {% set incremental = incremental_column is not none and not var("ratio_condition_full_scan", false) %}
+    {% if incremental and state_key is none %}
+        {{ exceptions.raise_compiler_error("ratio_condition: incremental_column needs a state_key") }}
+    {% endif %}
+    {% if sample_method not in ["system", "bernoulli"] %}
+        {{ exceptions.raise_compiler_error("ratio_condition: sample_method must be system or bernoulli") }}
+    {% endif %}
+
+    {% if incremental and execute %}
+        {% do run_query(ratio_condition_capture_sql(model, incremental_column, state_key)) %}
+        {#- tests never commit and the node's transaction is rolled back on release,
+            the on-run-end hook reads the bound from another connection -#}
+        {% do adapter.commit() %}
+    {% endif %}
+
     with base as (
         select *
         from {{ model }}
+        {% if sample_percent is not none %}
+        tablesample {{ sample_method }} ({{ sample_percent }})
+        {% endif %}
+        where true
         {% if where %}
-        where {{ where }}
+        and ({{ where }})
+        {% endif %}
+        {% if incremental %}
+        and {{ incremental_column }} > coalesce((
+            select watermark
+            from {{ ratio_condition_relation("state") }}
+            where state_key = '{{ state_key }}'
+        ), '-infinity')
+        and {{ incremental_column }} <= (
+            select watermark
+            from {{ ratio_condition_relation("pending") }}
+            where invocation_id = '{{ invocation_id }}' and state_key = '{{ state_key }}'
+        )
         {% endif %}
     ),
     stats as (
@@ -19,3 +72,96 @@
     from stats
     where (bad_count / nullif(total_count, 0)) > {{ max_ratio }}
 {% endtest %}
+
+
+{% macro ratio_condition_relation(name) %}
+    {{- "dbt_ops.ratio_condition_" ~ name -}}
+{% endmacro %}
+
+
+{% macro ratio_condition_capture_sql(model, incremental_column, state_key) %}
+    -- upper bound of this run's window, one index probe when incremental_column is indexed
+    insert into {{ ratio_condition_relation("pending") }} (invocation_id, state_key, watermark)
+    select '{{ invocation_id }}', '{{ state_key }}', max({{ incremental_column }})
+    from {{ model }}
+    on conflict (invocation_id, state_key) do update set
+        watermark = excluded.watermark,
+        captured_at_utc = now()
+{% endmacro %}
+
+
+{% macro ratio_condition_setup() %}
+    {#- on-run-start: watermark tables for incremental ratio_condition tests -#}
+    create schema if not exists dbt_ops;
+    create table if not exists {{ ratio_condition_relation("state") }} (
+        state_key text primary key,
+        watermark timestamp,
+        last_execution_seconds double precision,
+        updated_at_utc timestamptz not null default now()
+    );
+    create table if not exists {{ ratio_condition_relation("pending") }} (
+        invocation_id text not null,
+        state_key text not null,
+        watermark timestamp,
+        captured_at_utc timestamptz not null default now(),
+        primary key (invocation_id, state_key)
+    );
+{% endmacro %}
+
+
+{% macro ratio_condition_commit(results) %}
+    {#-
+        on-run-end: logs runtime and mode of every ratio_condition test and moves
+        the watermark of passing incremental ones to the bound they checked up to.
+    -#}
+    {% if not execute %}
+        {{ return("") }}
+    {% endif %}
+
+    {% set passed = [] %}
+    {% for result in results %}
+        {% set node = result.node %}
+        {% set test_metadata = node.test_metadata if node.resource_type == "test" else none %}
+        {% if test_metadata and test_metadata.name == "ratio_condition" %}
+            {% set kwargs = test_metadata.kwargs %}
+            {% set modes = [] %}
+            {% if kwargs.get("incremental_column") and not var("ratio_condition_full_scan", false) %}
+                {% do modes.append("incremental") %}
+            {% endif %}
+            {% if kwargs.get("sample_percent") is not none %}
+                {% do modes.append("sample " ~ kwargs.get("sample_percent") ~ "%") %}
+            {% endif %}
+            {% do log(
+                "ratio_condition " ~ node.name ~ " [" ~ (modes | join(", ") or "full") ~ "] "
+                ~ result.status ~ " in " ~ "%.3f" | format(result.execution_time or 0) ~ "s",
+                info=True
+            ) %}
+            {% if "incremental" in modes and result.status == "pass" %}
+                {% do passed.append((kwargs.get("state_key"), result.execution_time or 0)) %}
+            {% endif %}
+        {% endif %}
+    {% endfor %}
+
+    {% set statements = [] %}
+    {% for state_key, seconds in passed %}
+        {% do statements.append(
+            "insert into " ~ ratio_condition_relation("state")
+            ~ " (state_key, watermark, last_execution_seconds, updated_at_utc)"
+            ~ " select state_key, watermark, " ~ seconds ~ ", now()"
+            ~ " from " ~ ratio_condition_relation("pending")
+            ~ " where invocation_id = '" ~ invocation_id ~ "' and state_key = '" ~ state_key ~ "'"
+            ~ " and watermark is not null"
+            ~ " on conflict (state_key) do update set"
+            ~ " watermark = excluded.watermark,"
+            ~ " last_execution_seconds = excluded.last_execution_seconds,"
+            ~ " updated_at_utc = excluded.updated_at_utc"
+        ) %}
+    {% endfor %}
+    {% do statements.append(
+        "delete from " ~ ratio_condition_relation("pending")
+        ~ " where invocation_id = '" ~ invocation_id ~ "'"
+        ~ " or captured_at_utc < now() - interval '7 days'"
+    ) %}
+
+    {{ return(statements | join(";\n")) }}
+{% endmacro %}
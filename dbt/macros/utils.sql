@@ -14,11 +14,49 @@
 	end
 {% endmacro %}
 
+{% macro clock_from_deciseconds(field) %}
+	-- 5987 -> '0:09:58.7', the format of chess.com pgn clocks
+	to_char(make_interval(secs => ({{ field }}) / 10.0), 'FMHH24:MI:SS.FF1')
+{% endmacro %}
+
+{% macro unnest_rounds(move_san, clock_ds) %}
+	-- one row per round from the packed per-ply arrays (odd plies are white)
+	select
+		((ply + 1) / 2)::int as round,
+		max(san) filter (where ply % 2 = 1) as white_move,
+		max(clock) filter (where ply % 2 = 1) as white_clock_ds,
+		max(san) filter (where ply % 2 = 0) as black_move,
+		max(clock) filter (where ply % 2 = 0) as black_clock_ds
+	from unnest({{ move_san }}, {{ clock_ds }}) with ordinality as plies(san, clock, ply)
+	group by 1
+{% endmacro %}
+
 {% macro if(condition, if_true, if_false) %}
 	case when {{ condition }} then {{ if_true }} else {{ if_false }} end
 {% endmacro %}
 
+{% macro generated_column_name(cast_type, expr, alias) %}
+	{#- matches utilities.generated_columns.generated_column_name on the dagster side -#}
+	{{ return("gc_" ~ (alias | trim) ~ "_" ~ local_md5("text:" ~ (cast_type | trim) ~ ":" ~ (expr | trim))[:8]) }}
+{% endmacro %}
+
 {% macro type_mapper(column_mapping) %}
+	{#-
+		meta with generated_columns_from (a src table): mappings with a stored
+		generated column there read it instead of re-extracting the payload.
+		Those columns hold text, the cast to the mapped type stays here.
+	-#}
+	{% set generated = [] %}
+	{% if column_mapping is mapping and column_mapping.get("generated_columns_from") %}
+		{% set source_name, table_name = column_mapping.get("generated_columns_from").split(".") %}
+		{% set generated_from = source(source_name, table_name) %}
+		{% if execute %}
+			{% for col in adapter.get_columns_in_relation(generated_from) %}
+				{% do generated.append(col.name) %}
+			{% endfor %}
+		{% endif %}
+	{% endif %}
+
 	{% if column_mapping is mapping and column_mapping.get("column_mapping") is not none %}
 		{% set column_mapping = column_mapping.get("column_mapping") %}
 	{% endif %}
@@ -35,7 +73,12 @@
 			{% for expr, alias in mappings.items() %}
 				{% set e = expr | trim %}
 				{% set t = cast_type | trim %}
-				{% do rendered.append("(" ~ e ~ ")::" ~ t ~ " as " ~ alias) %}
+				{% set gc = generated_column_name(t, e, alias) %}
+				{% if gc in generated %}
+					{% do rendered.append("(" ~ gc ~ ")::" ~ t ~ " as " ~ alias) %}
+				{% else %}
+					{% do rendered.append("(" ~ e ~ ")::" ~ t ~ " as " ~ alias) %}
+				{% endif %}
 			{% endfor %}
 		{% else %}
 			{{ exceptions.raise_compiler_error(
@@ -50,6 +93,23 @@
 	{% endfor %}
 {% endmacro %}
 
+{% macro mapped_column(column_mapping, alias) %}
+	{#- the typed expression type_mapper renders for alias, from the payload -#}
+	{% if column_mapping is mapping and column_mapping.get("column_mapping") is not none %}
+		{% set column_mapping = column_mapping.get("column_mapping") %}
+	{% endif %}
+
+	{% for cast_type, mappings in (column_mapping or {}).items() %}
+		{% for expr, mapped_alias in mappings.items() %}
+			{% if (mapped_alias | trim) == alias %}
+				{{ return("(" ~ (expr | trim) ~ ")::" ~ (cast_type | trim)) }}
+			{% endif %}
+		{% endfor %}
+	{% endfor %}
+
+	{{ exceptions.raise_compiler_error("mapped_column() found no mapping for " ~ alias) }}
+{% endmacro %}
+
 {% macro meta_columns(column_mapping, exclude=[]) %}
 	{% if column_mapping is mapping and column_mapping.get("column_mapping") is not none %}
 		{% set column_mapping = column_mapping.get("column_mapping") %}
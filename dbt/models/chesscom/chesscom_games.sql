@@ -1,11 +1,13 @@
 {% set column_mapping = model.config.get("meta") %}
 {% set excl = ["end_dt", "time_control"] %}
-{% set cols = meta_columns(column_mapping, exclude=(excl + ["start_dt", "pgn_start_time", "moves"])) %}
+{% set packed_moves = ["move_san", "clock_ds", "move_from", "move_to", "move_promo"] %}
+{% set cols = meta_columns(column_mapping, exclude=(excl + packed_moves + ["start_dt", "pgn_start_time"])) %}
 
 with mapped as (
         select
             {{ type_mapper(column_mapping) }}
-        from {{ source('src_chesscom', 'games') }}
+        from {{ source('src_chesscom', 'game_members') }} as members
+        inner join {{ source('src_chesscom', 'game_payloads') }} as payloads using (game_url)
     ),
 	game_start as (
 		select 
@@ -19,7 +21,7 @@ with mapped as (
 				)}}
 			) as start_dt,
 			{{ excl | join(", ")}},
-			moves
+			{{ packed_moves | join(", ") }}
 		from mapped
 	)
 select
@@ -45,5 +47,5 @@ select
 		"split_part(time_control, '+', 2)::bigint",
 		"0::bigint"
 	) }} as time_control_increment_seconds,
-	moves
+	{{ packed_moves | join(", ") }}
 from game_start
@@ -0,0 +1,9 @@
+{{ config(materialized='view') }}
+
+-- chesscom.games plus the jsonb moves map it used to store, read from the
+-- payload at query time so the table only keeps the packed arrays
+select
+	games.*,
+	payloads.payload->'parsed_pgn'->'moves' as moves
+from {{ ref('chesscom_games') }} as games
+left join {{ source('src_chesscom', 'game_payloads') }} as payloads using (game_url)
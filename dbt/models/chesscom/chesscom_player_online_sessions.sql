@@ -1,3 +1,21 @@
+{{ config(
+    materialized='incremental',
+    unique_key='id',
+    incremental_strategy='delete+insert',
+    on_schema_change='fail'
+) }}
+
+{% if execute and is_incremental() %}
+	{#- tables built before the incremental rewrite have no session_id to carry -#}
+	{% set existing_columns = adapter.get_columns_in_relation(this) | map(attribute='name') | list %}
+	{% if 'session_id' not in existing_columns %}
+		{{ exceptions.raise_compiler_error(
+			this ~ " predates the incremental session model (no session_id column). "
+			~ "Rebuild it once with: dbt build --full-refresh -s chesscom_player_online_sessions"
+		) }}
+	{% endif %}
+{% endif %}
+
 {% set connected_session_threshold = 600 %}
 {% set login_padding %}
     60 * interval '1 second'
@@ -12,82 +30,109 @@ with player_and_game_sessions as (
             include=['id', 'username', 'start_dt', 'end_dt']
         ) }}
 	),
-	session_windows as (
-		select
-			id,
+{% if is_incremental() %}
+	open_sessions as (
+		-- a user's latest session is the only one new activity can extend,
+		-- everything before it is closed and keeps its session_id
+		select distinct on (username)
 			username,
-			start_dt,
-			end_dt,
-			lead(start_dt) over (partition by username order by start_dt) as next_session_start_dt,
-			lag(end_dt) over (partition by username order by start_dt) as previous_session_end_dt
+			session_id,
+			first_event_dt,
+			last_event_dt
+		from {{ this }}
+		order by username, first_event_dt desc
+	),
+	new_events as (
+		select ev.username, ev.start_dt, ev.end_dt
+		from player_and_game_sessions as ev
+		left join open_sessions as os on os.username = ev.username
+		where os.username is null
+			-- anything that can still touch the open session, incl. late events
+			-- that start before it; events inside its span change nothing
+			or (
+				ev.end_dt >= os.first_event_dt - {{ connected_session_threshold }} * interval '1 second'
+				and not (ev.start_dt >= os.first_event_dt and ev.end_dt <= os.last_event_dt)
+			)
+	),
+	events as (
+		select username, start_dt, end_dt, null::varchar as carried_session_id
+		from new_events
+
+		union all
+		-- the open session re-enters as a single event so it can
+		-- be extended (or closed) by the new events after it
+		select username, first_event_dt, last_event_dt, session_id
+		from open_sessions
+		where username in (select username from new_events)
+	),
+{% else %}
+	events as (
+		select username, start_dt, end_dt, null::varchar as carried_session_id
 		from player_and_game_sessions
 	),
-	connected_sessions as (
-		-- assumes online/games connected if there's <= 10 min between games
-		select *, (flag_connected_next or flag_connected_previous) as flag_connected
-		from (
-			select
-				id,
-				username,
-				start_dt,
-				end_dt,
-				coalesce(
-                    {{ connected_session_threshold }} >=
-					    extract(epoch from (start_dt - previous_session_end_dt)), 
-					false
-				) as flag_connected_previous,
-				coalesce(
-					{{ connected_session_threshold }} >=
-                        extract(epoch from (next_session_start_dt - end_dt)),
-					false
-				) as flag_connected_next
-			from session_windows
-		) as conn
+{% endif %}
+	session_windows as (
+		select
+			*,
+			-- latest end so far rather than the previous row's, events can overlap
+			max(end_dt) over (
+				partition by username
+				order by start_dt
+				rows between unbounded preceding and 1 preceding
+			) as previous_session_end_dt
+		from events
 	),
 	session_buckets as (
-		select *,
-			-- padding the front and back of a session w/ 30 seconds
-			-- to account for login and game review time spent
-			min(start_dt) over (
-                partition by username, bucket_number
-            ) - {{ login_padding }} as session_start_dt,
-			max(end_dt) over (
-                partition by username, bucket_number
-            ) + {{ login_padding }} as session_end_dt
-		from (
-			select
-				id,
-				username,
-				start_dt,
-				end_dt,
-				sum(
-					case 
-						when flag_connected_previous is distinct from true
-						then 1
-						else 0
-					end
-				) over (
-					partition by username
-					order by start_dt
-				) as bucket_number
-			from connected_sessions
-		) as buckets
+		-- assumes online/games connected if there's <= 10 min between games
+		select
+			*,
+			sum(
+				case
+					when coalesce(
+						{{ connected_session_threshold }} >=
+							extract(epoch from (start_dt - previous_session_end_dt)),
+						false
+					)
+					then 0
+					else 1
+				end
+			) over (
+				partition by username
+				order by start_dt
+			) as bucket_number
+		from session_windows
+	),
+	sessions as (
+		-- session ids derive from the user and the session's first event
+		-- (or are carried over), so late data never renumbers later sessions
+		select
+			username,
+			coalesce(
+				max(carried_session_id),
+				{{ dbt_utils.generate_surrogate_key(["username", "min(start_dt)"]) }}
+			) as session_id,
+			min(start_dt) as first_event_dt,
+			max(end_dt) as last_event_dt
+		from session_buckets
+		group by username, bucket_number
 	)
 select
     {{ dbt_utils.generate_surrogate_key([
         "username",
-        "bucket_number::varchar"
+        "session_id"
     ]) }} as id,
 	username,
-	bucket_number::varchar as session_id,
-	session_start_dt,
-	session_end_dt,
-	min(
-        extract(
-            epoch from (
-                session_end_dt - session_start_dt
-            )
-        )
-    ) as session_duration_seconds
-from session_buckets
-{{ dbt_utils.group_by(n=5) }}
+	session_id,
+	-- padding the front and back of a session w/ 60 seconds
+	-- to account for login and game review time spent
+	first_event_dt - {{ login_padding }} as session_start_dt,
+	last_event_dt + {{ login_padding }} as session_end_dt,
+	extract(
+		epoch from (
+			(last_event_dt + {{ login_padding }})
+				- (first_event_dt - {{ login_padding }})
+		)
+	) as session_duration_seconds,
+	first_event_dt,
+	last_event_dt
+from sessions
@@ -4,15 +4,6 @@
 with mapped as (
         select {{ type_mapper(column_mapping) }}
         from {{ source("src_chesscom", "player") }}
-    ),
-    last_game_impute as (
-        select src.username, src.ingested_dt, max(games.end_dt) as last_game_dt
-        from mapped as src
-        inner join 
-            {{ ref("chesscom_games") }} as games on
-            games.username = src.username
-            and games.end_dt <= src.ingested_dt
-        {{ dbt_utils.group_by(n=2) }}
     )
 select
     {{ dbt_utils.generate_surrogate_key([
@@ -31,8 +22,14 @@ select
         fields=["game.last_game_dt", "src.last_online_dt"]
     ) }} as last_online_dt
 from mapped as src
-left join 
-    last_game_impute as game on 
-    game.username = src.username
-    and game.ingested_dt = src.ingested_dt
+-- as-of lookup of the latest game at snapshot time, one index probe on
+-- chesscom.games (username, end_dt) per snapshot
+left join lateral (
+    select games.end_dt as last_game_dt
+    from {{ ref("chesscom_games") }} as games
+    where games.username = src.username
+        and games.end_dt <= src.ingested_dt
+    order by games.end_dt desc
+    limit 1
+) as game on true
 
@@ -1,12 +1,12 @@
 {% set column_mapping = model.config.get("meta") %}
-{% set cols = meta_columns(column_mapping, exclude=["white_clock", "black_clock", "white_move", "black_move", "game_end_dt", "time_control_seconds"]) %}
+{% set cols = meta_columns(column_mapping, exclude=["white_clock_ds", "black_clock_ds", "white_move", "black_move", "game_end_dt", "time_control_seconds"]) %}
 
 {% set white_ttm %}
-    extract(epoch from white_clock::interval)
+    white_clock_ds / 10.0
 {% endset %}
 
 {% set black_ttm %}
-    coalesce(extract(epoch from black_clock::interval), 0)
+    coalesce(black_clock_ds / 10.0, 0)
 {% endset %}
 
 {% set round_start %}
@@ -17,18 +17,20 @@
 with mapped as (
         select {{ type_mapper(column_mapping) }}
         from {{ ref('chesscom_games') }}
-        cross join lateral jsonb_each(moves) as e(k, v)
+        cross join lateral ({{ unnest_rounds("move_san", "clock_ds") }}) as r
         where time_class = 'daily'
     )
 select
     {{ dbt_utils.generate_surrogate_key(["game_id", "round"])}} as id,
     {{ cols | join(", ")}},
-    white_clock,
-    {{ if(
-        "round = max(round) over (partition by game_id)",
-        "coalesce(black_clock, '0:00:00.0')",
-        "black_clock"
-    )}} as black_clock,
+    {{ clock_from_deciseconds("white_clock_ds") }} as white_clock,
+    {{ clock_from_deciseconds(
+        if(
+            "round = max(round) over (partition by game_id)",
+            "coalesce(black_clock_ds, 0)",
+            "black_clock_ds"
+        )
+    ) }} as black_clock,
     white_move,
     {{ if(
         "round = max(round) over (partition by game_id)",
@@ -45,4 +47,4 @@ select
     {{ black_ttm }} as black_move_duration_seconds,
     {{ white_ttm }} + {{ black_ttm }} as round_duration_seconds
 from mapped
-where white_clock is not null
+where white_clock_ds is not null
@@ -6,11 +6,11 @@
 {% endset %}
 
 {% set white_remaining_seconds %}
-    extract(epoch from white_clock::interval)
+    white_clock_ds / 10.0
 {% endset %}
 
 {% set black_remaining_seconds %}
-    extract(epoch from black_clock::interval)
+    black_clock_ds / 10.0
 {% endset %}
 
 {% set black_final_turn_timeout %}
@@ -25,10 +25,42 @@
     ) = 0
 {% endset %}
 
+{% set black_clock_ds_imputed %}
+    case
+        when flag_last_round
+        then coalesce(
+            -- prefers black clock if present
+            -- essentially means black moved
+            -- before a terminal game state
+            black_clock_ds,
+            case
+                -- cases where black times
+                -- out we impute with 0
+                when {{ black_final_turn_timeout }}
+                then 0
+                -- cases where black is mated or abandons
+                -- their time left on the clock does not
+                -- change from the previous round
+                else (
+                -- last black clock - final round duration - white move duration
+                    lag(black_clock_ds) over (
+                        partition by game_id
+                        order by round
+                    ) - round((
+                        extract(epoch from (round_end_dt - round_start_dt)::interval)
+                            - white_move_duration_seconds
+                    ) * 10)::int
+                )
+            end
+        )
+        else black_clock_ds
+    end
+{% endset %}
+
 with mapped as (
         select {{ type_mapper(column_mapping) }}
         from {{ ref('chesscom_games') }}
-        cross join lateral jsonb_each(moves) as e(k, v)
+        cross join lateral ({{ unnest_rounds("move_san", "clock_ds") }}) as r
         where time_class != 'daily'
     ),
     seconds_parsing as (
@@ -134,38 +166,8 @@ select
         "extract(epoch from (round_end_dt - round_start_dt)::interval) - white_move_duration_seconds",
         "black_move_duration_seconds"
     )}} as black_move_duration_seconds,
-	white_clock,
-	case 
-        when flag_last_round
-        then coalesce(
-            -- prefers black clock if present
-            -- essentially means black moved  
-            -- before a terminal game state
-            black_clock,
-            case
-                -- cases where black times
-                -- out we impute with 0
-                when {{ black_final_turn_timeout }}                  
-                then '0:00:00.0'
-                -- cases where black is mated or abandons
-                -- their time left on the clock does not
-                -- change from the previous round
-                else substring((
-                -- last black clock - final round duration - white move duration
-                    (
-                        lag(black_clock) over (
-                            partition by game_id 
-                            order by round
-                        )
-                    )::interval - (
-                        (extract(epoch from (round_end_dt - round_start_dt)::interval) 
-                            - white_move_duration_seconds) * interval '1 second'
-                    )
-                )::varchar from 2)
-                end
-            )
-        else black_clock
-    end as black_clock,
+	{{ clock_from_deciseconds("white_clock_ds") }} as white_clock,
+	{{ clock_from_deciseconds(black_clock_ds_imputed) }} as black_clock,
     white_remaining_seconds,
     case
         when flag_last_round
@@ -179,21 +181,19 @@ select
                 -- cases where black is mated or abandons
                 -- their time left on the clock does not
                 -- change from the previous round
-                else extract(epoch from (
+                else (
                 -- last black clock - final round duration - white move duration
-                    (
-                        lag(black_clock) over (
-                            partition by game_id 
-                            order by round
-                        )
-                    )::interval - (
-                        (extract(epoch from (round_end_dt - round_start_dt)::interval) 
-                            - white_move_duration_seconds) * interval '1 second'
+                    lag(black_clock_ds) over (
+                        partition by game_id 
+                        order by round
+                    ) / 10.0 - (
+                        extract(epoch from (round_end_dt - round_start_dt)::interval) 
+                            - white_move_duration_seconds
                     )
-                ))
+                )
             end
         )
         else black_remaining_seconds
     end as black_remaining_seconds
 from round_start_and_end_times
-where white_clock is not null
+where white_clock_ds is not null
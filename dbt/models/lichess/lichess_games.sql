@@ -0,0 +1,22 @@
+{% set column_mapping = model.config.get("meta") %}
+{% set cols = meta_columns(column_mapping) %}
+
+with mapped as (
+        select
+            {{ type_mapper(column_mapping) }}
+        from {{ source('src_lichess', 'games') }}
+    )
+select
+	{{ dbt_utils.generate_surrogate_key([
+		'username',
+		'game_id'
+	]) }} as id,
+	end_dt = min(end_dt) over (partition by username) as flag_first_game,
+	end_dt = max(end_dt) over (partition by username) as flag_latest_game,
+	{{ cols | join(", ") }},
+	{{ if(
+		"lower(white_username) = lower(username)",
+		"'white'",
+		"'black'"
+	) }} as color
+from mapped
@@ -0,0 +1,58 @@
+{{ config(tags=["regression"]) }}
+
+-- chesscom_player_snapshot finds the last game per snapshot with an as-of
+-- lateral probe, it must match the range join + max(end_dt) it replaced.
+-- The range join is quadratic per player, so the check runs on a sample: the
+-- most recently snapshotted players (`as_of_regression_players`) and their
+-- snapshots of the last `as_of_regression_days`.
+{% set snapshot_meta = {} %}
+{% if execute %}
+	{% set snapshot_model = graph.nodes.values()
+		| selectattr("resource_type", "equalto", "model")
+		| selectattr("name", "equalto", "chesscom_player_snapshot")
+		| first %}
+	{% set snapshot_meta = snapshot_model.config.meta %}
+{% endif %}
+
+with players as (
+		select username
+		from {{ ref("chesscom_player_snapshot") }}
+		group by username
+		order by max(ingested_dt) desc, username
+		limit {{ var("as_of_regression_players", 100) }}
+	),
+	snapshots as (
+		select username, ingested_dt, last_online_dt
+		from {{ ref("chesscom_player_snapshot") }}
+		where username in (select username from players)
+			and ingested_dt >= (
+				select max(ingested_dt) from {{ ref("chesscom_player_snapshot") }}
+			) - {{ var("as_of_regression_days", 7) }} * interval '1 day'
+	),
+	src_last_online as (
+		-- the same expressions the model maps the payload with
+		select
+			username,
+			{{ mapped_column(snapshot_meta, "ingested_dt") if execute else "null" }} as ingested_dt,
+			{{ mapped_column(snapshot_meta, "last_online_dt") if execute else "null" }} as last_online_dt
+		from {{ source("src_chesscom", "player") }}
+		where username in (select username from players)
+	),
+	range_join as (
+		select snapshots.username, snapshots.ingested_dt, max(games.end_dt) as last_game_dt
+		from snapshots
+		inner join
+			{{ ref("chesscom_games") }} as games on
+			games.username = snapshots.username
+			and games.end_dt <= snapshots.ingested_dt
+		{{ dbt_utils.group_by(n=2) }}
+	)
+select
+	snapshots.username,
+	snapshots.ingested_dt,
+	snapshots.last_online_dt,
+	greatest(range_join.last_game_dt, src.last_online_dt) as expected_last_online_dt
+from snapshots
+left join range_join using (username, ingested_dt)
+left join src_last_online as src using (username, ingested_dt)
+where snapshots.last_online_dt is distinct from greatest(range_join.last_game_dt, src.last_online_dt)